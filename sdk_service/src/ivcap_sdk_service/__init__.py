@@ -3,26 +3,59 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
 
-# read version from installed package
+if TYPE_CHECKING:
+    from .ivcap import deliver_data, fetch_data, register_saver, create_metadata, SCHEMA_KEY
+    from .ivcap import get_config, get_order_id, get_node_id
+    from .run import register_service
+    from .parallel import map_collection
+    from .aio import afetch_data, adeliver_data, AsyncReadable, AsyncWritable
+    from .service import Service, Parameter, Option, Type
+    from .service import Workflow, BasicWorkflow, PythonWorkflow
+    from .cio.io_adapter import IOAdapter, OnCloseF, IOWritable, IOReadable
+    from .itypes import MissingParameterValue, UnsupportedMimeType, UploadError, SupportedMimeTypes, ServiceArgs
 
+# Public names and the modules defining them. Modules are only imported when one
+# of their names is first used, which keeps 'import ivcap_sdk_service' cheap.
+_LAZY = {
+    **dict.fromkeys(['deliver_data', 'fetch_data', 'register_saver', 'create_metadata', 'SCHEMA_KEY',
+                     'get_config', 'get_order_id', 'get_node_id'], '.ivcap'),
+    'register_service': '.run',
+    'map_collection': '.parallel',
+    **dict.fromkeys(['afetch_data', 'adeliver_data', 'AsyncReadable', 'AsyncWritable'], '.aio'),
+    **dict.fromkeys(['Service', 'Parameter', 'Option', 'Type',
+                     'Workflow', 'BasicWorkflow', 'PythonWorkflow'], '.service'),
+    **dict.fromkeys(['IOAdapter', 'OnCloseF', 'IOWritable', 'IOReadable'], '.cio.io_adapter'),
+    **dict.fromkeys(['MissingParameterValue', 'UnsupportedMimeType', 'UploadError',
+                     'SupportedMimeTypes', 'ServiceArgs'], '.itypes'),
+}
 
-try:  # Python < 3.10 (backport) 
-    from importlib_metadata import version 
-except ImportError: 
-    from importlib.metadata import version 
+__all__ = list(_LAZY.keys())
 
-try:   
-    __version__ = version("ivcap_sdk_service")
-except Exception:
-    __version__ = "unknown"
+def __getattr__(name: str) -> Any:
+    if name == '__version__':
+        v = _version()
+    else:
+        module = _LAZY.get(name)
+        if not module:
+            raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+        v = getattr(import_module(module, __name__), name)
+    globals()[name] = v
+    return v
 
+def __dir__() -> List[str]:
+    return sorted(list(globals().keys()) + __all__ + ['__version__'])
 
-from .ivcap import deliver_data, fetch_data, register_saver, create_metadata, SCHEMA_KEY
-from .ivcap import get_config, register_saver, get_order_id, get_node_id
-from .run import register_service
-from .service import Service, Parameter, Option, Type
-from .service import Workflow, BasicWorkflow, PythonWorkflow
+def _version() -> str:
+    # read version from installed package
+    try:  # Python < 3.10 (backport)
+        from importlib_metadata import version
+    except ImportError:
+        from importlib.metadata import version
 
-from .cio.io_adapter import IOAdapter, OnCloseF, IOWritable, IOReadable
-from .itypes import MissingParameterValue, UnsupportedMimeType, SupportedMimeTypes, ServiceArgs
\ No newline at end of file
+    try:
+        return version("ivcap_sdk_service")
+    except Exception:
+        return "unknown"
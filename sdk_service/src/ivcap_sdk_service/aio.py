@@ -0,0 +1,223 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Asyncio versions of 'fetch_data' and 'deliver_data'.
+
+The blocking I/O of the readables, writables and HTTP requests is run on a dedicated
+pool of threads (see IVCAP_AIO_WORKERS), which share the pooled HTTP connections of
+'cio.utils.http_session'. This allows a single process to keep many transfers in flight
+without any additional dependencies.
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import io
+import os
+import threading
+from typing import Any, AnyStr, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, TypeVar, Union
+
+from .cio.io_adapter import IOReadable, IOWritable, OnCloseF
+from .context import wrap
+from .delivery import get_executor
+from .itypes import MetaDict, MissingParameterValue, SupportedMimeTypes, Url
+from . import ivcap
+
+# Number of threads running blocking I/O for async callers. Defaults to the size of the
+# HTTP connection pool (IVCAP_HTTP_POOL_SIZE), more threads would only wait for a connection.
+AIO_WORKERS = int(os.getenv('IVCAP_AIO_WORKERS', os.getenv('IVCAP_HTTP_POOL_SIZE', 16)))
+
+T = TypeVar('T')
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def _aio_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if not _EXECUTOR:
+            _EXECUTOR = ThreadPoolExecutor(AIO_WORKERS, thread_name_prefix='aio')
+        return _EXECUTOR
+
+def _reset_executor():
+    # threads of the parent don't exist in a forked child
+    global _EXECUTOR, _EXECUTOR_LOCK
+    _EXECUTOR = None
+    _EXECUTOR_LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+def _run(fn: Callable[..., T], *args) -> Awaitable[T]:
+    return asyncio.get_running_loop().run_in_executor(_aio_executor(), wrap(fn), *args)
+
+class AsyncReadable:
+    """Async wrapper of an 'IOReadable'. Supports 'async with' and 'async for'
+    (over chunks).
+
+    Args:
+        readable (IOReadable): The wrapped readable
+    """
+
+    def __init__(self, readable: IOReadable):
+        self._readable = readable
+
+    @property
+    def name(self) -> str:
+        return self._readable.name
+
+    @property
+    def readable(self) -> IOReadable:
+        """The wrapped (blocking) readable"""
+        return self._readable
+
+    async def read(self, n: int = -1) -> AnyStr:
+        return await _run(self._readable.read, n)
+
+    async def readinto(self, b) -> int:
+        return await _run(self._readable.readinto, b)
+
+    async def readline(self, limit: int = -1) -> AnyStr:
+        return await _run(self._readable.readline, limit)
+
+    async def readlines(self, hint: int = -1) -> List[AnyStr]:
+        return await _run(self._readable.readlines, hint)
+
+    async def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return await _run(self._readable.seek, offset, whence)
+
+    async def tell(self) -> int:
+        return await _run(self._readable.tell)
+
+    async def as_local_file(self) -> str:
+        return await _run(self._readable.as_local_file)
+
+    async def iter_chunks(self, size: int = 1024 * 1024) -> AsyncIterator[AnyStr]:
+        while True:
+            chunk = await self.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+    def __aiter__(self) -> AsyncIterator[AnyStr]:
+        return self.iter_chunks()
+
+    async def close(self) -> None:
+        await _run(self._readable.close)
+
+    @property
+    def closed(self) -> bool:
+        return self._readable.closed
+
+    async def __aenter__(self) -> 'AsyncReadable':
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __repr__(self):
+        return f"<AsyncReadable {self._readable}>"
+
+class AsyncWritable:
+    """Async wrapper of an 'IOWritable'. The content is uploaded when it is
+    closed, which 'async with' does on exit. If the block raises, the content
+    is discarded instead (see 'abort').
+
+    Args:
+        writable (IOWritable): The wrapped writable
+    """
+
+    def __init__(self, writable: IOWritable):
+        self._writable = writable
+
+    @property
+    def name(self) -> str:
+        return self._writable.name
+
+    async def write(self, s: AnyStr) -> int:
+        return await _run(self._writable.write, s)
+
+    async def writelines(self, lines: List[AnyStr]) -> None:
+        await _run(self._writable.writelines, lines)
+
+    async def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return await _run(self._writable.seek, offset, whence)
+
+    async def tell(self) -> int:
+        return await _run(self._writable.tell)
+
+    async def truncate(self, size: int = None) -> int:
+        return await _run(self._writable.truncate, size)
+
+    async def flush(self) -> None:
+        await _run(self._writable.flush)
+
+    async def close(self) -> None:
+        await _run(self._writable.close)
+
+    async def abort(self) -> None:
+        await _run(self._writable.abort)
+
+    @property
+    def closed(self) -> bool:
+        return self._writable.closed
+
+    async def __aenter__(self) -> 'AsyncWritable':
+        return self
+
+    async def __aexit__(self, exc_type, *args):
+        if exc_type:
+            await self.abort()
+        else:
+            await self.close()
+
+    def __repr__(self):
+        return f"<AsyncWritable {self._writable}>"
+
+async def afetch_data(url: Url, binary_content=True, no_caching=False, seekable=False) -> AsyncReadable:
+    """Return an 'AsyncReadable' on the content referenced by 'url'.
+
+    See 'fetch_data' for the arguments.
+    """
+    r = await _run(ivcap.fetch_data, url, binary_content, no_caching, seekable)
+    return AsyncReadable(r)
+
+async def adeliver_data(
+    name: str,
+    data_or_lambda: Union[Any, Callable[[AsyncWritable], Awaitable[None]], Callable[[IOWritable], None]],
+    mime_type: Union[str, SupportedMimeTypes],
+    collection_name: Optional[str] = None,
+    metadata: Optional[Union[MetaDict, Sequence[MetaDict]]] = None,
+    seekable=False,
+    on_close: Optional[OnCloseF] = None
+) -> None:
+    """Deliver a result of this service and return once it has been uploaded.
+
+    See 'deliver_data' for the arguments. In addition, 'data_or_lambda' can be an
+    'async' function, which is called with an 'AsyncWritable' to provide the data.
+    Like the other deliveries, it is waited for when the service completes its
+    deliveries. Its error is only raised here, so a caller handling it doesn't
+    fail the order.
+
+    Raises:
+        NotImplementedError: Raised when no saver function is defined for 'type'
+        UploadError: Raised when the upload fails
+    """
+    if asyncio.iscoroutinefunction(data_or_lambda):
+        if not mime_type:
+            raise MissingParameterValue('mime_type')
+        io_adapter = ivcap.get_config().IO_ADAPTER
+        _on_close = ivcap._on_delivered(name, mime_type, metadata, on_close)
+        f = Future()
+        get_executor().track(f, name)
+        try:
+            fhdl = await _run(io_adapter.write_artifact, mime_type, name, collection_name, metadata, seekable, _on_close)
+            async with AsyncWritable(fhdl) as w:
+                await data_or_lambda(w)
+        finally:
+            # an error is raised to the caller, not recorded for 'drain' as well
+            f.set_result(None)
+        return
+    # 'deliver_data' may block when too many deliveries are pending
+    f = await _run(ivcap.deliver_data, name, data_or_lambda, mime_type, collection_name, metadata, seekable, on_close)
+    await asyncio.wrap_future(f)
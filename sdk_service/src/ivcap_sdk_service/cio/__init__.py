@@ -3,7 +3,32 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
-from .io_adapter import IOAdapter
-from .local_io_adapter import LocalIOAdapter
-from .ivcap_io_adapter import IvcapIOAdapter
-from .cache import Cache
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:
+    from .io_adapter import IOAdapter
+    from .local_io_adapter import LocalIOAdapter
+    from .ivcap_io_adapter import IvcapIOAdapter
+    from .cache import Cache
+
+# The adapters pull in 'requests' and friends, so only load them when first used
+_LAZY = {
+    'IOAdapter': '.io_adapter',
+    'LocalIOAdapter': '.local_io_adapter',
+    'IvcapIOAdapter': '.ivcap_io_adapter',
+    'Cache': '.cache',
+}
+
+__all__ = list(_LAZY.keys())
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if not module:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    v = getattr(import_module(module, __name__), name)
+    globals()[name] = v
+    return v
+
+def __dir__() -> List[str]:
+    return sorted(list(globals().keys()) + __all__)
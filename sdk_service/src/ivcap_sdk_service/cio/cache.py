@@ -3,75 +3,607 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
-from hashlib import sha256
-import re
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from os.path import join
 from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Mapping, Optional, Tuple
+
+import requests
 
 from ..itypes import Url
 from ..logger import sys_logger as logger
 
+from .catalog import CATALOG_FILE, CacheCatalog, CacheEntry
 from .io_adapter import IOReadable
+from .readable_file import ReadableFile
+from .utils import download, get_cache_name, map_file, open_stream, unmap_file
+
+try:  # not available on Windows
+    import fcntl
+except ImportError:
+    fcntl = None
 
+DEF_CACHE_POLICY = 'lru'
+DEF_REVALIDATE_TTL = 60 # sec
+STALE_PART_AGE = 60 * 60 # sec
+FILL_CHUNK_SIZE = 64 * 1024
 
 class Cache():
     """
-    A storage adapter to fetch and cache remote artifacts 
+    A storage adapter to fetch and cache remote artifacts
     in a local directory.
 
+    If 'max_bytes' is set, the least recently used entries are removed
+    whenever a new entry pushes the total size of the cache over that
+    budget. Alternatively, 'policy' can be set to 'lfu' (least frequently used)
+    or 'size' (largest entries first).
+
+    All entries are recorded in a catalog (SQLite) in the cache directory, together
+    with their source, size, mime type, access statistics and the 'ETag',
+    'Last-Modified' and 'X-Cache-Id' headers of the remote content. The catalog is
+    loaded once, after which lookups are served from memory. An entry older than
+    'revalidate_ttl' seconds is revalidated with a conditional GET before being
+    used again. If the remote content has changed, the response to that request
+    is used to fill the entry again.
+
+    Only one requester fills an entry at a time, even across processes
+    sharing the cache directory. The content is downloaded into a temporary
+    file which is atomically renamed into place when complete. Concurrent
+    requesters of the same content wait for that and then use the finished entry.
+    Unless a seekable readable is requested, the requester filling the entry doesn't
+    wait but reads the content while it is being written into the temporary file.
+
     Attributes
     ----------
     cache_dir: str
         Path path to local cache directory, set via Config/API
-    out_dir: str
-        Path for output data, set via Config/API
+    max_bytes: int
+        Upper limit of the total size of all cached files (None for no limit)
+    policy: str
+        Eviction policy, one of 'lru', 'lfu', or 'size' [IVCAP_CACHE_POLICY]
+    revalidate_ttl: float
+        Seconds an entry is used without checking the remote content [IVCAP_CACHE_REVALIDATE_TTL=60]
 
     Methods
     -------
     get_and_cache_file(url: Url) -> IOReadable
         Return a readable for 'url'
+    stats() -> Dict[str, Any]
+        Return size and usage statistics
     """
-    def __init__(self, cache_dir: str) -> None:
-        self.url2path = {}
+    def __init__(self,
+        cache_dir: str,
+        max_bytes: Optional[int] = None,
+        policy: Optional[str] = None,
+        revalidate_ttl: Optional[float] = None,
+    ) -> None:
         Path(cache_dir).mkdir(parents=True, exist_ok=True)
-        from .local_io_adapter import LocalIOAdapter # avoid circular dependencies
-        self.cacheIO = LocalIOAdapter(
-            in_dir=cache_dir,
-            out_dir=cache_dir
-        )
-        self._cache_dir = cache_dir
-
-    def get_and_cache_file(self, url: Url) -> IOReadable:
+        self._cache_dir = os.path.abspath(cache_dir)
+        self._max_bytes = max_bytes if max_bytes and max_bytes > 0 else None
+        self._policy = policy if policy else os.getenv('IVCAP_CACHE_POLICY', DEF_CACHE_POLICY)
+        if not self._policy in _EVICTION_ORDER:
+            raise ValueError(f"Unknown cache eviction policy '{self._policy}' - expected one of {', '.join(_EVICTION_ORDER.keys())}")
+        if revalidate_ttl == None:
+            revalidate_ttl = float(os.getenv('IVCAP_CACHE_REVALIDATE_TTL', DEF_REVALIDATE_TTL))
+        self._revalidate_ttl = revalidate_ttl
+        self._lock = threading.Lock()
+        # cname -> (lock, number of threads holding or waiting for it)
+        self._fill_locks: Dict[str, Tuple[threading.Lock, List[int]]] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'evicted': 0}
+        catalog_path = join(self._cache_dir, CATALOG_FILE)
+        is_new = not os.path.exists(catalog_path)
+        self._catalog = CacheCatalog(catalog_path)
+        self._remove_stale_parts()
+        if is_new:
+            self._import_dir()
+        self._entries: Dict[str, CacheEntry] = self._catalog.load()
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @property
+    def size(self) -> int:
+        """Total size of all cached files"""
+        with self._lock:
+            return sum(e.size for e in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number and total size of the cached entries, as well as
+        the hits, misses, revalidations, and evictions of this process"""
+        with self._lock:
+            d = dict(self._stats)
+            d['entries'] = len(self._entries)
+            d['bytes'] = sum(e.size for e in self._entries.values())
+        d['max_bytes'] = self._max_bytes
+        d['policy'] = self._policy
+        return d
+
+    def get_and_cache_file(self,
+        url: Url,
+        binary_content=True,
+        seekable=False,
+        key: Optional[str] = None,
+        immutable=False,
+    ) -> IOReadable:
         """Return a readable on a local file representing 'url'
-        
+
         Before fetching the remote content, we check if a local
         copy has already been fetched previously. If yes, a IOReadable
         is returned on that local copy.
-        
-        If not, we first download the content into a local file in
-        `_cache_dir` and then return a  IOReadable on that local
-        file.
-        
-        Plese note, we currently do NOT check if the remote content
-        has changed (no check on ETag)
+
+        Unless the content is declared `immutable`, such as the content of an
+        artifact, and the local copy hasn't been validated for more than `revalidate_ttl`
+        seconds, we first ask the server if the content has changed since
+        (conditional GET with the 'ETag' and 'Last-Modified' received
+        originally). If it hasn't, the local copy is used without transferring
+        the content again.
+
+        If not, the content is downloaded into `_cache_dir`. If `seekable` is
+        requested (or the content isn't binary) we wait for the download to finish
+        and return a readable on the new local copy. Otherwise, the download continues in
+        the background and the returned readable follows it. If another thread or
+        process is already fetching the same content, we wait for it to finish
+        instead. Adding a new entry may evict older ones to stay within `max_bytes`.
 
         Args:
             url (Url): URL to content requested
+            binary_content (bool, optional): If true content is expected to be of binary format otherwise text is expected. Defaults to True.
+            seekable (bool, optional): If true, returned readable should be seekable
+            key (str, optional): Identifies the content in the cache if different to `url`, such as an artifact ID. Defaults to `url`.
+            immutable (bool, optional): If true, the content never changes and is not revalidated. Defaults to False.
 
         Returns:
             IOReadable: A readable on the content referenced by `url`
         """
-        cname = get_cache_name(url)
-        if self.cacheIO.readable_local(cname):
-            logger.debug("Cache#get_and_cache_file: Hit! '%s' already cached as '%s'", url, cname)
-            return self.cacheIO.read_local(cname)
+        name = key if key else url
+        cname = get_cache_name(name)
+        started = time.time()
+        stale = False
+        response = None # of a revalidation which found the content changed
+        entry = self._lookup(cname)
+        if entry:
+            fresh = True
+            if not immutable:
+                fresh, response = self._revalidate(url, entry)
+            if fresh:
+                r = self._open(entry, name, binary_content)
+                if r:
+                    logger.debug("Cache#get_and_cache_file: Hit! '%s' already cached as '%s'", name, cname)
+                    return r
+                logger.debug("Cache#get_and_cache_file: '%s' disappeared, fetch again", cname)
+            else:
+                logger.debug("Cache#get_and_cache_file: '%s' has changed, fetch again", url)
+                stale = True
+
+        release = self._lock_fill(cname)
+        try:
+            # someone else may have filled it while we were waiting
+            entry = self._catalog.get(cname)
+            if entry and (not stale or entry.validated_at >= started):
+                with self._lock:
+                    self._entries[cname] = entry
+                r = self._open(entry, name, binary_content)
+                if r:
+                    logger.debug("Cache#get_and_cache_file: '%s' got cached by someone else", name)
+                    return r
+            if entry:
+                self._remove(cname)
+            logger.debug("Cache#get_and_cache_file: Cache '%s' locally as '%s'", name, cname)
+            with self._lock:
+                self._stats['misses'] += 1
+            if binary_content and not seekable:
+                r = self._fill_behind(url, cname, name, response, release)
+                # both are now owned by the fill
+                release, response = None, None
+                return r
+            headers = self._fill(url, cname, response)
+            self._add(cname, name, url, headers)
+        finally:
+            if release:
+                release()
+            if response != None:
+                response.close()
+        return ReadableFile(f"{name} (cached)", join(self._cache_dir, cname), is_binary=binary_content)
+
+    def _lookup(self, cname: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(cname)
+        if not entry:
+            # may have been added by another process sharing this directory
+            entry = self._catalog.get(cname)
+            if entry:
+                with self._lock:
+                    self._entries[cname] = entry
+        return entry
+
+    def _open(self, entry: CacheEntry, name: str, binary_content: bool) -> Optional[ReadableFile]:
+        """Return a readable on 'entry' and record the access, or None if its
+        file has been removed (e.g. evicted by another process)"""
+        try:
+            r = ReadableFile(f"{name} (cached)", join(self._cache_dir, entry.name), is_binary=binary_content)
+        except FileNotFoundError:
+            self._remove(entry.name)
+            return None
+        with self._lock:
+            entry.last_access = time.time()
+            entry.hits += 1
+            self._stats['hits'] += 1
+        self._catalog.touch(entry)
+        return r
+
+    def _fill(self, url: Url, cname: str, response: Optional[requests.Response] = None) -> Mapping[str, str]:
+        """Download 'url' into a temp file and atomically move it to 'cname' when complete.
+        If 'response' is given, its body is the content."""
+        fd, tmp = tempfile.mkstemp(dir=self._cache_dir, prefix=f".{cname}.", suffix='.part')
+        try:
+            with os.fdopen(fd, 'w+b') as f:
+                if response != None:
+                    headers = _copy_response(response, f)
+                else:
+                    headers = download(url, f, close_fhdl=False)
+            os.replace(tmp, join(self._cache_dir, cname))
+            return headers
+        except BaseException as ex:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise ex
+
+    def _fill_behind(self,
+        url: Url,
+        cname: str,
+        name: str,
+        response: Optional[requests.Response],
+        release: Callable[[], None],
+    ) -> IOReadable:
+        """Download 'url' (or the body of 'response') into a temp file in a background
+        thread and return a readable following the download. 'release' is called
+        once the entry has been added (or the download failed)."""
+        # report a failing request to the requester right away
+        r = response if response != None else open_stream(url)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self._cache_dir, prefix=f".{cname}.", suffix='.part')
+        except BaseException as ex:
+            r.close()
+            raise ex
+        progress = _FillProgress(tmp)
+        try:
+            reader = _FollowingReader(f"{name} (cached)", progress)
+        except BaseException as ex:
+            r.close()
+            os.close(fd)
+            os.remove(tmp)
+            raise ex
+
+        def fill():
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    try:
+                        for chunk in r.iter_content(chunk_size=FILL_CHUNK_SIZE):
+                            f.write(chunk)
+                            f.flush()
+                            progress.advance(len(chunk))
+                        headers = r.headers
+                    finally:
+                        r.close()
+                path = join(self._cache_dir, cname)
+                os.replace(tmp, path)
+            except Exception as err:
+                logger.warning("Cache#_fill_behind: Cannot fetch '%s' - %s", url, err)
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                progress.fail(err)
+                release()
+                return
+            try:
+                self._add(cname, name, url, headers)
+            except Exception as err:
+                logger.warning("Cache#_fill_behind: Cannot add '%s' - %s", cname, err)
+            finally:
+                release()
+                # a reader which got all of the content will find the entry
+                progress.finish(path)
+
+        threading.Thread(target=fill, name=f"cache-fill-{cname[:8]}", daemon=True).start()
+        return reader
+
+    def _lock_fill(self, cname: str) -> Callable[[], None]:
+        """Acquire an exclusive lock on filling 'cname' and return a function releasing
+        it, which may be called from another thread. Within the process this is a thread
+        lock, across processes an 'flock' on a lock file in the cache directory. The lock
+        files are never removed, otherwise two processes could hold a lock on different files.
+        The thread lock is dropped once no thread holds or waits for it."""
+        with self._lock:
+            lock, users = self._fill_locks.setdefault(cname, (threading.Lock(), [0]))
+            users[0] += 1
+
+        def unlock():
+            with self._lock:
+                users[0] -= 1
+                if users[0] == 0:
+                    del self._fill_locks[cname]
+            lock.release()
+
+        lock.acquire()
+        if not fcntl:
+            return unlock
+        try:
+            lf = open(join(self._cache_dir, f".{cname}.lock"), 'a')
+            fcntl.flock(lf, fcntl.LOCK_EX)
+        except BaseException as ex:
+            unlock()
+            raise ex
+
+        def release():
+            try:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+                lf.close()
+            finally:
+                unlock()
+        return release
+
+    def _revalidate(self, url: Url, entry: CacheEntry) -> Tuple[bool, Optional[requests.Response]]:
+        """Return true if the cached content of 'url' can still be used. Otherwise
+        also return the (unread) response with the new content, if there is one."""
+        if time.time() - entry.validated_at < self._revalidate_ttl:
+            return (True, None)
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        if not headers:
+            return (False, None) # nothing to validate against
+        try:
+            r = open_stream(url, headers=headers)
+        except Exception as err:
+            logger.warning("Cache#_revalidate: Cannot revalidate '%s', use cached copy - %s", url, err)
+            return (True, None)
+        if r.status_code != 304:
+            return (False, r)
+        etag = r.headers.get('ETag')
+        r.close()
+        with self._lock:
+            entry.validated_at = time.time()
+            if etag:
+                entry.etag = etag
+            self._stats['revalidated'] += 1
+        self._catalog.validated(entry)
+        logger.debug("Cache#_revalidate: '%s' has not changed", url)
+        return (True, None)
+
+    def _remove_stale_parts(self):
+        """Remove temp files left behind by fills which never completed, e.g. because
+        the process exited during a background fill"""
+        for e in os.scandir(self._cache_dir):
+            try:
+                if e.name.endswith('.part') and e.stat().st_mtime < time.time() - STALE_PART_AGE:
+                    os.remove(e.path)
+            except OSError:
+                pass
+
+    def _import_dir(self):
+        """Add files left by earlier versions, which had no catalog, using 'mtime' as
+        last access and the headers kept in '.<name>.meta' files"""
+        for e in os.scandir(self._cache_dir):
+            if e.name.startswith('.') or not e.is_file():
+                continue
+            st = e.stat()
+            entry = CacheEntry(e.name, st.st_size, st.st_mtime, created_at=st.st_mtime)
+            meta_path = join(self._cache_dir, f".{e.name}.meta")
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                for k, v in meta.items():
+                    if hasattr(entry, k) and v != None:
+                        setattr(entry, k, v)
+                os.remove(meta_path)
+            except (OSError, ValueError):
+                pass
+            self._catalog.put(entry)
+
+    def _add(self, cname: str, key: str, url: Url, headers: Optional[Mapping[str, str]] = None):
+        try:
+            size = os.stat(join(self._cache_dir, cname)).st_size
+        except OSError as err:
+            logger.warning("Cache#_add: cannot find new entry '%s' - %s", cname, err)
+            return
+        now = time.time()
+        entry = CacheEntry(cname, size, now, validated_at=now, key=key, url=url, created_at=now)
+        if headers:
+            entry.etag = headers.get('ETag')
+            entry.last_modified = headers.get('Last-Modified')
+            entry.cache_id = headers.get('X-Cache-Id')
+            entry.mime_type = headers.get('Content-Type')
+        self._catalog.put(entry)
+        with self._lock:
+            self._entries[cname] = entry
+        self._evict(keep=cname)
+
+    def _remove(self, cname: str):
+        with self._lock:
+            self._entries.pop(cname, None)
+        self._catalog.remove(cname)
+        try:
+            os.remove(join(self._cache_dir, cname))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: Optional[str] = None):
+        """Remove entries in order of the eviction policy until the
+        cache fits into 'max_bytes' again. 'keep' is never removed."""
+        if not self._max_bytes:
+            return
+        with self._lock:
+            if sum(e.size for e in self._entries.values()) <= self._max_bytes:
+                return
+        # other processes may have added or removed entries meanwhile
+        entries = self._catalog.load()
+        with self._lock:
+            self._entries = entries
+            total = sum(e.size for e in entries.values())
+            victims = sorted(entries.values(), key=_EVICTION_ORDER[self._policy])
+            for e in victims:
+                if total <= self._max_bytes:
+                    break
+                if e.name == keep:
+                    continue
+                try:
+                    os.remove(join(self._cache_dir, e.name))
+                except FileNotFoundError:
+                    pass
+                except OSError as err:
+                    logger.warning("Cache#_evict: cannot remove '%s' - %s", e.name, err)
+                    continue
+                logger.debug("Cache#_evict: Evicted '%s' (%d bytes)", e.name, e.size)
+                self._catalog.remove(e.name)
+                del self._entries[e.name]
+                self._stats['evicted'] += 1
+                total -= e.size
+
+    def __repr__(self):
+        return f"<Cache cache_dir={self._cache_dir} max_bytes={self._max_bytes} policy={self._policy}>"
+
+def _copy_response(r: requests.Response, fhdl: BinaryIO) -> Mapping[str, str]:
+    """Write the body of the streaming response 'r' into 'fhdl' and return its headers"""
+    for chunk in r.iter_content(chunk_size=None):
+        fhdl.write(chunk)
+    fhdl.flush()
+    return r.headers
+
+class _FillProgress:
+    """Progress of a download into 'path', shared between the downloading thread
+    and the readers following it"""
+    def __init__(self, path: str):
+        self.path = path
+        self.written = 0
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def advance(self, n: int):
+        with self._cond:
+            self.written += n
+            self._cond.notify_all()
+
+    def finish(self, path: str):
+        with self._cond:
+            self.path = path
+            self._done = True
+            self._cond.notify_all()
+
+    def fail(self, err: BaseException):
+        with self._cond:
+            self._error = err
+            self._cond.notify_all()
+
+    def wait_for(self, n: Optional[int] = None):
+        """Wait until 'n' bytes have been written or the download is complete.
+        Raises the error of a failed download."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._done or self._error or (n != None and self.written >= n))
+            if self._error:
+                raise IOError(f"Fetching '{self.path}' failed - {self._error}") from self._error
+
+class _FollowingReader(IOReadable):
+    """Reads a file while it is being downloaded, waiting for content
+    which hasn't been written yet"""
+    def __init__(self, name: str, progress: _FillProgress):
+        self._name = name
+        self._progress = progress
+        self._file_obj = io.open(progress.path, mode='rb')
+        self._mmap = None
+
+    @property
+    def mode(self) -> str:
+        return 'rb'
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def closed(self) -> bool:
+        return self._file_obj.closed
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return False
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_END:
+            self._progress.wait_for()
+        return self._file_obj.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file_obj.tell()
+
+    def read(self, n: int = -1) -> bytes:
+        if n == None or n < 0:
+            self._progress.wait_for()
         else:
-            logger.debug("Cache#get_and_cache_file: Cache '%s' locally as '%s'", url, cname)
-            return self.cacheIO.read_external(url, local_file_name=cname)
+            self._progress.wait_for(self._file_obj.tell() + n)
+        return self._file_obj.read(n)
+
+    def readinto(self, b) -> int:
+        self._progress.wait_for(self._file_obj.tell() + memoryview(b).nbytes)
+        return self._file_obj.readinto(b)
+
+    def readline(self, limit: int = -1) -> bytes:
+        line = b''
+        while limit < 0 or len(line) < limit:
+            self._progress.wait_for(self._file_obj.tell() + 1)
+            chunk = self._file_obj.readline(-1 if limit < 0 else limit - len(line))
+            if not chunk:
+                break # end of content
+            line += chunk
+            if chunk.endswith(b'\n'):
+                break
+        return line
+
+    def readlines(self, hint: int = -1) -> List[bytes]:
+        lines = []
+        size = 0
+        for line in self:
+            lines.append(line)
+            size += len(line)
+            if hint > 0 and size >= hint:
+                break
+        return lines
+
+    def as_local_file(self) -> str:
+        self._progress.wait_for()
+        return self._progress.path
+
+    def as_memoryview(self) -> memoryview:
+        if self._mmap == None:
+            self._progress.wait_for()
+            self._mmap = map_file(self._file_obj)
+        return memoryview(self._mmap)
+
+    def close(self):
+        unmap_file(self._mmap)
+        self._file_obj.close()
 
     def __repr__(self):
-        return f"<Cache cache_dir={self._cache_dir}>"
+        return f"<_FollowingReader name={self._name} path={self._progress.path}>"
 
-def get_cache_name(url: Url) -> str:
-    name = re.search('.*/([^/]+)', url)[1]
-    encoded_name = f"{sha256(url.encode('utf-8')).hexdigest()}-{name}"
-    return encoded_name
+_EVICTION_ORDER = {
+    'lru': lambda e: e.last_access,
+    'lfu': lambda e: (e.hits, e.last_access),
+    'size': lambda e: -e.size,
+}
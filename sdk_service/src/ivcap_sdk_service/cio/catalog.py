@@ -0,0 +1,169 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Persistent catalog of the entries of a cache directory
+"""
+import atexit
+from dataclasses import astuple, dataclass, fields
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import weakref
+
+from ..logger import sys_logger as logger
+
+CATALOG_FILE = '.catalog.db'
+# Seconds the access statistics of cache hits are collected before writing them to the catalog
+TOUCH_FLUSH_INTERVAL = float(os.getenv('IVCAP_CACHE_STATS_INTERVAL', 5))
+
+@dataclass
+class CacheEntry:
+    """Book keeping for a file in the cache directory"""
+    name: str
+    size: int
+    last_access: float
+    hits: int = 0
+    # validators of the remote content at the time it got cached
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    cache_id: Optional[str] = None
+    validated_at: float = 0
+    # what the entry holds
+    key: Optional[str] = None
+    url: Optional[str] = None
+    mime_type: Optional[str] = None
+    created_at: float = 0
+
+_COLUMNS = [f.name for f in fields(CacheEntry)]
+
+class CacheCatalog:
+    """Keeps the cache entries in a SQLite database inside the cache directory.
+
+    The database is shared by all processes using the same cache directory. Each
+    process loads it once and then only writes changes through, so lookups are
+    served from memory. Accesses recorded with 'touch' are collected and written
+    at most every IVCAP_CACHE_STATS_INTERVAL seconds, as well as before loading
+    all entries and when the process exits.
+
+    Args:
+        path (str): Path to the database file
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        # name -> (last access, number of hits) not written yet
+        self._touched: Dict[str, Tuple[float, int]] = {}
+        self._flushed_at = time.time()
+        self._connect()
+        _CATALOGS.add(self)
+        cols = ', '.join(f"{c} {_sql_type(c)}" for c in _COLUMNS)
+        self._execute(f"CREATE TABLE IF NOT EXISTS entries ({cols}, PRIMARY KEY (name))")
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._db = sqlite3.connect(self._path, timeout=30, check_same_thread=False, isolation_level=None)
+        try:
+            self._db.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError as err:
+            logger.debug("CacheCatalog: cannot switch '%s' to WAL - %s", self._path, err)
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            self._check_pid()
+            return self._db.execute(sql, params).fetchall()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # connections must not be shared with a forked child. Closing the inherited
+            # one would release the parent's locks on the database, so it is kept open.
+            _INHERITED.append(self._db)
+            self._touched = {}
+            self._connect()
+
+    def load(self) -> Dict[str, CacheEntry]:
+        """Return all entries by name"""
+        self.flush()
+        rows = self._execute(f"SELECT {', '.join(_COLUMNS)} FROM entries")
+        return {r[0]: CacheEntry(*r) for r in rows}
+
+    def get(self, name: str) -> Optional[CacheEntry]:
+        rows = self._execute(f"SELECT {', '.join(_COLUMNS)} FROM entries WHERE name = ?", (name,))
+        return CacheEntry(*rows[0]) if rows else None
+
+    def put(self, entry: CacheEntry):
+        """Add or replace 'entry'"""
+        marks = ', '.join('?' for _ in _COLUMNS)
+        self._execute(f"INSERT OR REPLACE INTO entries ({', '.join(_COLUMNS)}) VALUES ({marks})", astuple(entry))
+
+    def touch(self, entry: CacheEntry):
+        """Record an access to 'entry'"""
+        with self._lock:
+            last_access, hits = self._touched.get(entry.name, (0, 0))
+            self._touched[entry.name] = (max(last_access, entry.last_access), hits + 1)
+            due = time.time() - self._flushed_at >= TOUCH_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the recorded accesses to the database"""
+        with self._lock:
+            self._check_pid()
+            touched, self._touched = self._touched, {}
+            self._flushed_at = time.time()
+            if not touched:
+                return
+            params = [(last_access, hits, name) for name, (last_access, hits) in touched.items()]
+            self._db.execute('BEGIN')
+            try:
+                self._db.executemany("UPDATE entries SET last_access = MAX(last_access, ?), hits = hits + ? WHERE name = ?", params)
+                self._db.execute('COMMIT')
+            except BaseException as ex:
+                self._db.execute('ROLLBACK')
+                raise ex
+
+    def validated(self, entry: CacheEntry):
+        """Record a successful revalidation of 'entry'"""
+        self._execute("UPDATE entries SET validated_at = ?, etag = ? WHERE name = ?", (entry.validated_at, entry.etag, entry.name))
+
+    def remove(self, name: str):
+        self._execute("DELETE FROM entries WHERE name = ?", (name,))
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def __repr__(self):
+        return f"<CacheCatalog path={self._path}>"
+
+# Connections inherited from a parent process, see 'CacheCatalog._check_pid'
+_INHERITED: List[sqlite3.Connection] = []
+_CATALOGS: 'weakref.WeakSet[CacheCatalog]' = weakref.WeakSet()
+
+def _reset_locks():
+    # a lock held by another thread of the parent would never be released
+    for c in list(_CATALOGS):
+        c._lock = threading.Lock()
+
+def _flush_all():
+    for c in list(_CATALOGS):
+        try:
+            c.flush()
+        except Exception as err:
+            logger.debug("CacheCatalog: cannot write access statistics to '%s' - %s", c._path, err)
+
+os.register_at_fork(after_in_child=_reset_locks)
+atexit.register(_flush_all)
+
+def _sql_type(column: str) -> str:
+    if column in ('size', 'hits'):
+        return 'INTEGER'
+    if column in ('last_access', 'validated_at', 'created_at'):
+        return 'REAL'
+    return 'TEXT'
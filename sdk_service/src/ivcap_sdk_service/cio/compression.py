@@ -0,0 +1,71 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Content-Encoding support for uploading artifacts. Downloads are decoded
+transparently by 'requests', which advertises every encoding it can decode.
+"""
+import os
+import re
+from typing import BinaryIO, Iterator, Optional
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from ..logger import sys_logger as logger
+
+# Encoding used for uploading compressible content: '' (none), 'gzip' or 'zstd'
+UPLOAD_COMPRESSION = os.getenv('IVCAP_UPLOAD_COMPRESSION', '')
+# Content of known size smaller than this is uploaded as is
+UPLOAD_COMPRESSION_MIN_SIZE = int(os.getenv('IVCAP_UPLOAD_COMPRESSION_MIN_SIZE', 64 * 1024))
+
+# Mime types which usually compress well. Images, video and most scientific
+# formats are already compressed.
+COMPRESSIBLE_TYPES = re.compile(r'^(text/.*|application/(json|xml|csv|x-ndjson|jsonl|netcdf|x-netcdf|.*\+json|.*\+xml))$')
+
+CHUNK_SIZE = 1024 * 1024
+
+def upload_encoding(mime_type: str, size: Optional[int] = None) -> Optional[str]:
+    """Return the Content-Encoding to upload content of 'mime_type' and 'size'
+    (None if unknown) with, or None if it should be uploaded as is"""
+    encoding = UPLOAD_COMPRESSION
+    if not encoding or not COMPRESSIBLE_TYPES.match(mime_type.split(';')[0].strip()):
+        return None
+    if size != None and size < UPLOAD_COMPRESSION_MIN_SIZE:
+        return None
+    if encoding == 'zstd' and zstandard == None:
+        logger.warning("compression: 'zstandard' package is not installed, use 'gzip' instead")
+        encoding = 'gzip'
+    if encoding not in ('gzip', 'zstd'):
+        logger.warning("compression: unsupported upload compression '%s'", encoding)
+        return None
+    return encoding
+
+def _compressor(encoding: str):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor().compressobj()
+    return zlib.compressobj(wbits=31) # gzip framing
+
+def compress_chunks(chunks: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a stream of chunks with 'encoding'"""
+    c = _compressor(encoding)
+    for chunk in chunks:
+        out = c.compress(chunk)
+        if out:
+            yield out
+    yield c.flush()
+
+def compress_file(src: BinaryIO, dst: BinaryIO, encoding: str) -> int:
+    """Compress the remaining content of 'src' into 'dst' and return the
+    number of bytes written"""
+    n = 0
+    for chunk in compress_chunks(iter(lambda: src.read(CHUNK_SIZE), b''), encoding):
+        dst.write(chunk)
+        n += len(chunk)
+    dst.flush()
+    return n
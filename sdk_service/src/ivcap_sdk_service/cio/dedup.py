@@ -0,0 +1,92 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Local index of uploaded artifacts by content hash
+"""
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from ..logger import sys_logger as logger
+
+# Skip uploading content which has already been uploaded under the same name, mime type and collection
+UPLOAD_DEDUP = os.getenv('IVCAP_UPLOAD_DEDUP', 'false').lower() in ('1', 'true', 'yes')
+
+INDEX_FILE = '.uploads.jsonl'
+
+DedupKey = Tuple[str, str, str, Optional[str]]
+# ID and URL of an uploaded artifact
+DedupEntry = Tuple[str, Optional[str]]
+
+class DedupIndex:
+    """Maps the SHA-256 of uploaded content (together with its name, mime type and
+    collection) to the ID and URL of the artifact created for it.
+
+    The index is an append-only JSON-lines file, so several processes can share it.
+    Entries appended by other processes are picked up when a lookup misses.
+
+    Args:
+        path (str): Path to index file
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._entries: Dict[DedupKey, DedupEntry] = {}
+        self._loaded = 0 # bytes of the file already loaded
+        self._lock = threading.Lock()
+
+    def lookup(self, sha256: str, name: str, mime_type: str, collection_name: Optional[str] = None) -> Optional[DedupEntry]:
+        """Return the ID and URL of the artifact uploaded with this content, or None"""
+        key = (sha256, name, mime_type, collection_name)
+        with self._lock:
+            if key not in self._entries:
+                self._load()
+            return self._entries.get(key)
+
+    def add(self,
+        sha256: str,
+        name: str,
+        mime_type: str,
+        artifact_id: str,
+        url: Optional[str] = None,
+        collection_name: Optional[str] = None,
+    ):
+        line = json.dumps({
+            'sha256': sha256, 'name': name, 'mime-type': mime_type, 'collection': collection_name,
+            'id': artifact_id, 'url': url,
+        }) + '\n'
+        with self._lock:
+            self._entries[(sha256, name, mime_type, collection_name)] = (artifact_id, url)
+            try:
+                # a single small write with O_APPEND doesn't interleave with other processes
+                fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line.encode('utf-8'))
+                finally:
+                    os.close(fd)
+            except OSError as err:
+                logger.warning("DedupIndex: cannot record upload in '%s' - %s", self._path, err)
+
+    def _load(self):
+        try:
+            with open(self._path, 'rb') as f:
+                f.seek(self._loaded)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break # partially written
+                    self._loaded += len(line)
+                    try:
+                        e = json.loads(line)
+                        key = (e['sha256'], e['name'], e['mime-type'], e.get('collection'))
+                        self._entries[key] = (e['id'], e.get('url'))
+                    except (ValueError, KeyError):
+                        logger.debug("DedupIndex: ignore malformed entry in '%s'", self._path)
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self):
+        return f"<DedupIndex path={self._path} #entries={len(self._entries)}>"
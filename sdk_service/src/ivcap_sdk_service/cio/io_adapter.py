@@ -4,7 +4,7 @@
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
 from abc import ABC, abstractmethod
-from typing import AnyStr, List, Callable, Optional, Sequence, Union
+from typing import AnyStr, Iterator, List, Callable, Optional, Sequence, Union
 import io
 
 from ..itypes import MetaDict, Url
@@ -58,6 +58,19 @@ class IOReadable(_IOBase):
     def read(self, n: int = -1) -> AnyStr:
         pass
 
+    def readinto(self, b) -> int:
+        """Read bytes into the pre-allocated, writable buffer 'b' and return
+        the number of bytes read (0 at the end of the content)."""
+        m = memoryview(b).cast('B')
+        data = self.read(len(m))
+        n = len(data)
+        m[:n] = data
+        return n
+
+    def readinto1(self, b) -> int:
+        """Like 'readinto' but with at most one read from the underlying source"""
+        return self.readinto(b)
+
     @abstractmethod
     def readline(self, limit: int = -1) -> AnyStr:
         pass
@@ -66,11 +79,42 @@ class IOReadable(_IOBase):
     def readlines(self, hint: int = -1) -> List[AnyStr]:
         pass
 
+    def __iter__(self) -> Iterator[AnyStr]:
+        """Iterate over the lines of the content"""
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def iter_chunks(self, size: int = 1024 * 1024) -> Iterator[AnyStr]:
+        """Iterate over the content in chunks of 'size' (the last one may be shorter)"""
+        while True:
+            chunk = self.read(size)
+            if not chunk:
+                return
+            yield chunk
+
     @property
     @abstractmethod
     def as_local_file(self) -> str:
         pass
 
+    def as_memoryview(self) -> memoryview:
+        """Return a read-only memoryview on the entire content without copying it
+        into memory, e.g. for 'numpy.frombuffer'. The view stays valid until it is
+        released, even after the readable has been closed.
+
+        Raises:
+            io.UnsupportedOperation: If the content cannot be memory-mapped
+        """
+        raise io.UnsupportedOperation("as_memoryview")
+
+    def prefetch(self) -> None:
+        """Hint that the content will be read soon. Implementations may start
+        fetching it in the background. The default does nothing."""
+        pass
+
 class IOWritable(_IOBase):
     @abstractmethod
     def write(self, s: AnyStr) -> int:
@@ -88,6 +132,11 @@ class IOWritable(_IOBase):
     def flush(self) -> None:
         pass
 
+    def abort(self) -> None:
+        """Discard the content written so far instead of delivering it, e.g. after
+        the code providing the content failed. The default simply closes the writable."""
+        self.close()
+
 
 class IO_ReadWritable(IOReadable, IOWritable):
     pass
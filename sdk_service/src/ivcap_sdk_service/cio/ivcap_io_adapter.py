@@ -7,18 +7,24 @@
 Implementation of the IOAdapter class for use inside the IVCAP platform
 """
 import os
+import re
 from typing import Callable, Optional, Sequence, Union
 from os import access, R_OK
 from os.path import isfile
-from urllib.parse import urlparse
+from urllib.parse import urlencode, urlparse
 
 from .readable_file import ReadableFile
 from .readable_proxy import ReadableProxy
+from .cache import Cache
+from .dedup import INDEX_FILE, UPLOAD_DEDUP, DedupIndex
+from .remote_collection import COLLECTION_PAGE_SIZE, RemoteCollection
 from ..itypes import MetaDict, Url
 
 from .io_adapter import Collection, IOAdapter, IOReadable, IOWritable, OnCloseF
 from .writable_proxy import WritableProxy
 
+_ARTIFACT_URN = re.compile(r'^urn:[^:]+:artifact:')
+
 class IvcapIOAdapter(IOAdapter):
     """
     An adapter for operating inside an IVCAP container.
@@ -29,12 +35,17 @@ class IvcapIOAdapter(IOAdapter):
         out_dir: str, 
         order_id:str, 
         cachable_url: Callable[[str], str],
+        cache: Optional[Cache] = None,
     ) -> None:
         super().__init__()
         self.in_dir = os.path.abspath(in_dir)
         self.out_dir = os.path.abspath(out_dir)
         self.storage_url = storage_url
         self.cachable_url = cachable_url
+        self.cache = cache
+        self.dedup = None
+        if UPLOAD_DEDUP and cache:
+            self.dedup = DedupIndex(os.path.join(cache.cache_dir, INDEX_FILE))
 
     def read_artifact(self, artifact_id: str, binary_content=True, no_caching=False, seekable=False) -> IOReadable:
         """Return a readable file-like object providing the content of an artifact
@@ -54,7 +65,10 @@ class IvcapIOAdapter(IOAdapter):
             return self.read_external(url, binary_content, no_caching, seekable)
         
         curl = self.cachable_url(artifact_id)
-        ior = ReadableProxy(curl, name=artifact_id, is_binary=binary_content)
+        if self.cache and not no_caching:
+            # artifacts never change, so no need to ever check again
+            return self.cache.get_and_cache_file(curl, binary_content, seekable, key=artifact_id, immutable=True)
+        ior = ReadableProxy(curl, name=artifact_id, is_binary=binary_content, stream=not seekable)
         return ior
 
     def read_external(self, 
@@ -82,7 +96,9 @@ class IvcapIOAdapter(IOAdapter):
                 curl = url
             else:
                 curl = self.cachable_url(url)
-        ior = ReadableProxy(curl, name=url, is_binary=binary_content)
+            if self.cache:
+                return self.cache.get_and_cache_file(curl, binary_content, seekable, key=url)
+        ior = ReadableProxy(curl, name=url, is_binary=binary_content, stream=not seekable)
         return ior
 
     def artifact_readable(self, artifact_id: str) -> bool:
@@ -130,7 +146,8 @@ class IvcapIOAdapter(IOAdapter):
             if on_close:
                 on_close(url)
 
-        return WritableProxy(self.storage_url, mime_type, metadata, name, on_close=_on_close)
+        return WritableProxy(self.storage_url, mime_type, metadata, name, is_seekable=seekable, on_close=_on_close,
+            dedup=self.dedup, collection_name=collection_name)
 
     def readable_local(self, name: str, collection_name: str = None) -> bool:
         """Return true if file exists and is readable. If 'name' starts with a '/'
@@ -158,7 +175,7 @@ class IvcapIOAdapter(IOAdapter):
             IOReadable: The content of the local file as a file-like object
         """
         path = self._to_path(self.in_dir, name, collection_name)
-        return ReadableFile(name, path, None, is_binary=binary_content, use_temp_file=False)
+        return ReadableFile(name, path, None, is_binary=binary_content)
 
     def _to_path(self, prefix: str, name: str, collection_name: str = None) -> str:
         if name.startswith('/'):
@@ -172,12 +189,21 @@ class IvcapIOAdapter(IOAdapter):
                 return os.path.join(prefix, name)
 
     def get_collection(self, collection_urn: str) -> Collection:
-        return IvcapCollection(collection_urn)
+        """Return the collection 'collection_urn'. An artifact URN is treated
+        as a collection with that single artifact.
 
-    def __repr__(self):
-        return f"<IvcapIOAdapter in_dir={self.in_dir} out_dir={self.out_dir}>"
+        Args:
+            collection_urn (str): URN of collection (or artifact)
 
-class IvcapCollection(Collection):
-    def __init__(self, collection_urn: str) -> None:
-        super().__init__()
-        self._collection_urn = collection_urn
+        Returns:
+            Collection: An iterable over the readables of the collection's artifacts
+        """
+        open_item = lambda item, _: self.read_artifact(item['id'])
+        if _ARTIFACT_URN.match(collection_urn):
+            return RemoteCollection(collection_urn, None, open_item, items=[{'id': collection_urn}])
+        q = urlencode({'filter': f"collection eq '{collection_urn}'", 'limit': COLLECTION_PAGE_SIZE})
+        list_url = f"{self.storage_url}/1/artifacts?{q}"
+        return RemoteCollection(collection_urn, list_url, open_item)
+
+    def __repr__(self):
+        return f"<IvcapIOAdapter in_dir={self.in_dir} out_dir={self.out_dir} cache={self.cache}>"
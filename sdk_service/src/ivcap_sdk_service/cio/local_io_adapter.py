@@ -11,14 +11,16 @@ import os
 from pathlib import Path
 from typing import Optional
 from os import access, R_OK
-from os.path import isfile, join
+from os.path import isfile
 from urllib.parse import urlparse
 from .readable_file import ReadableFile
 
 from .readable_proxy import ReadableProxy
 from .writable_file import WritableFile
+from .cache import Cache
+from .prefetch import PrefetchIter
+from .remote_collection import ArtifactItem, RemoteCollection, artifact_data_url
 
-from .utils import get_cache_name
 from ..utils import json_dump
 from ..itypes import MetaDict, Url, SupportedMimeTypes
 
@@ -29,7 +31,7 @@ class LocalIOAdapter(IOAdapter):
     """
     An adapter for a standard file system backend.
     """
-    def __init__(self, in_dir: str, out_dir: str, cache_dir: str=None) -> None:
+    def __init__(self, in_dir: str, out_dir: str, cache: Optional[Cache]=None) -> None:
         """
         Initialise FileAdapter data paths
 
@@ -41,6 +43,8 @@ class LocalIOAdapter(IOAdapter):
             Path of input data
         out_dir: str
             Path of output data
+        cache: Cache
+            Optional cache for external content
 
         Returns
         -------
@@ -50,7 +54,7 @@ class LocalIOAdapter(IOAdapter):
         super().__init__()
         self.in_dir = os.path.abspath(in_dir)
         self.out_dir = os.path.abspath(out_dir)
-        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.cache = cache
 
     def read_artifact(self, artifact_id: str, binary_content=True, no_caching=False, seekable=False) -> IOReadable:
         """Return a readable file-like object providing the content of an artifact
@@ -75,7 +79,6 @@ class LocalIOAdapter(IOAdapter):
         binary_content=True, 
         no_caching=False, 
         seekable=False,
-        local_file_name=None
     ) -> IOReadable:
         """Return a readable file-like object providing the content of an external data item.
 
@@ -88,17 +91,9 @@ class LocalIOAdapter(IOAdapter):
         Returns:
             IOReadable: The content of the external data item as a file-like object
         """
-        cache = None
-        if self.cache_dir and not no_caching:
-            cname = local_file_name if local_file_name else join(self.cache_dir, get_cache_name(url))
-            if isfile(cname) and access(cname, R_OK):
-                return ReadableFile(f"{url} (cached)", cname, is_binary=binary_content)
-            cache = WritableFile(cname, is_binary=binary_content)
-
-        ior = ReadableProxy(url, url, is_binary=binary_content, cache=cache)
-        if cache:
-            logger.debug("LocalIOAdapter#read_external: Cache external content '%s' into '%s'", url, cache.name)
-        return ior
+        if self.cache and not no_caching:
+            return self.cache.get_and_cache_file(url, binary_content=binary_content, seekable=seekable)
+        return ReadableProxy(url, url, is_binary=binary_content, stream=not seekable)
 
     def artifact_readable(self, artifact_id: str) -> bool:
         """Return true if artifact exists and is readable
@@ -199,8 +194,13 @@ class LocalIOAdapter(IOAdapter):
                 return LocalCollection(u.path, self)
             else:
                 raise ValueError(f"Cannot find local file or directory '{u.path}")
+        elif u.scheme == 'http' or u.scheme == 'https':
+            # an artifact listing, whose items are artifact IDs we can't read directly
+            def open_item(item: ArtifactItem, page_url: str) -> IOReadable:
+                return self.read_external(artifact_data_url(item, page_url))
+            return RemoteCollection(collection_urn, collection_urn, open_item)
         else:
-            raise ValueError(f"Remote collection is not supported, yet")
+            raise ValueError(f"Unsupported collection reference '{collection_urn}'")
     def __repr__(self):
         return f"<LocalIOAdapter in_dir={self.in_dir} out_dir={self.out_dir}>"
 
@@ -215,29 +215,7 @@ class LocalCollection(Collection):
     
     def __iter__(self):
         if os.path.isfile(self._path):
-            return SingleFileIter(self._path, self._adapter)
+            paths = [self._path]
         else:
-            return DirectoryIter(self._path, self._adapter)
-
-class SingleFileIter:
-    def __init__(self, path: str, adapter: IOAdapter) -> None:
-        self._path = path
-        self._adapter = adapter
-        self._already_served = False
-        
-    def __next__(self):
-        if self._already_served:
-            raise StopIteration
-        else:
-            self._already_served = True
-            return self._adapter.read_local(self._path)
-
-class DirectoryIter:
-    def __init__(self, path: str, adapter: IOAdapter) -> None:
-        self._iter = Path(path).glob('*')
-        self._adapter = adapter
-        self._already_served = False
-        
-    def __next__(self):
-        f = str(next(self._iter))
-        return self._adapter.read_local(f)
+            paths = (str(p) for p in sorted(Path(self._path).glob('*')) if p.is_file())
+        return PrefetchIter(paths, self._adapter.read_local)
@@ -0,0 +1,103 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+import os
+from typing import Callable, Deque, Iterable, Optional, TypeVar
+
+from ..logger import sys_logger as logger
+from .io_adapter import IOReadable
+
+# Number of collection items opened ahead of the one being processed
+PREFETCH_WINDOW = int(os.getenv('IVCAP_PREFETCH_WINDOW', 4))
+# Number of threads opening items in the background
+PREFETCH_WORKERS = int(os.getenv('IVCAP_PREFETCH_WORKERS', 2))
+
+T = TypeVar('T')
+
+class PrefetchIter:
+    """Iterates over readables, opening the next 'window' items in the background.
+
+    Each item of 'items' is turned into a readable by 'open' on a thread pool, followed
+    by a call to the readable's 'prefetch', while the caller processes earlier items. At
+    most 'window' items are opened but not yet returned, which bounds memory and the
+    number of open file handles. Items are returned in order, and an error raised while
+    opening an item is raised when that item is reached. Call 'close' when stopping
+    before the end, which releases the items opened ahead (also done when the
+    iterator is garbage collected).
+
+    Args:
+        items (Iterable[T]): References to the items, e.g. paths or URLs
+        open (Callable[[T], IOReadable]): Returns a readable for an item
+        window (int, optional): Number of items opened ahead [IVCAP_PREFETCH_WINDOW=4]
+        workers (int, optional): Number of threads [IVCAP_PREFETCH_WORKERS=2]
+    """
+
+    def __init__(self,
+        items: Iterable[T],
+        open: Callable[[T], IOReadable],
+        window: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
+        self._items = iter(items)
+        self._open = open
+        self._window = window if window != None else PREFETCH_WINDOW
+        workers = workers if workers else PREFETCH_WORKERS
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='prefetch') if self._window > 0 else None
+        self._pending: Deque[Future] = deque()
+        self._exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> IOReadable:
+        if not self._executor:
+            return self._open(next(self._items))
+        self._fill()
+        if not self._pending:
+            self.close()
+            raise StopIteration
+        r = self._pending.popleft().result()
+        self._fill()
+        return r
+
+    def close(self):
+        """Stop prefetching and close all readables opened but not yet returned"""
+        self._exhausted = True
+        while self._pending:
+            f = self._pending.popleft()
+            if not f.cancel():
+                f.add_done_callback(_close_result)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _fill(self):
+        while not self._exhausted and len(self._pending) < self._window:
+            try:
+                item = next(self._items)
+            except StopIteration:
+                self._exhausted = True
+                break
+            self._pending.append(self._executor.submit(copy_context().run, self._open_item, item))
+
+    def _open_item(self, item: T) -> IOReadable:
+        r = self._open(item)
+        try:
+            r.prefetch()
+        except BaseException as err:
+            logger.debug("PrefetchIter: prefetching '%s' failed - %s", item, err)
+        return r
+
+def _close_result(f: Future):
+    if not f.cancelled() and not f.exception():
+        f.result().close()
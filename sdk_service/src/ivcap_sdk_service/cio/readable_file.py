@@ -7,8 +7,9 @@ from builtins import BaseException
 from typing import IO, AnyStr, Callable, List, Optional
 import tempfile
 import io
+import os
 
-from ivcap_sdk_service.cio.utils import download
+from ivcap_sdk_service.cio.utils import download, map_file, unmap_file
 from ..logger import sys_logger as logger
 
 from .io_adapter import IOReadable
@@ -24,10 +25,12 @@ class ReadableFile(IOReadable):
     ):
         self._name = name
         self._path = path
+        self._is_binary = is_binary
         mode = "rb" if is_binary else "r"
         self._file_obj = io.open(path, mode=mode, encoding=encoding)
         self._on_close = on_close
         self._closed = False
+        self._mmap = None
 
     @property
     def closed(self) -> bool:
@@ -44,6 +47,11 @@ class ReadableFile(IOReadable):
     def as_local_file(self) -> str:
         return self._path
 
+    def as_memoryview(self) -> memoryview:
+        if self._mmap == None:
+            self._mmap = map_file(self._file_obj)
+        return memoryview(self._mmap)
+
     def writable(self) -> bool:
         return False
 
@@ -54,7 +62,7 @@ class ReadableFile(IOReadable):
         """
         Change stream position by offset
         """
-        self._file_obj.seek(offset, whence)
+        return self._file_obj.seek(offset, whence)
 
     def seekable(self) -> bool:
         return True
@@ -68,6 +76,21 @@ class ReadableFile(IOReadable):
     def read(self, n: int = -1) -> AnyStr:
         return self._file_obj.read(n)
 
+    def prefetch(self) -> None:
+        """Ask the OS to read the file into the page cache"""
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self._file_obj.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+
+    def readinto(self, b) -> int:
+        if not self._is_binary:
+            raise io.UnsupportedOperation("readinto - content is not binary")
+        return self._file_obj.readinto(b)
+
+    def readinto1(self, b) -> int:
+        if not self._is_binary:
+            raise io.UnsupportedOperation("readinto1 - content is not binary")
+        return self._file_obj.readinto1(b)
+
     def readline(self, limit: int = -1) -> AnyStr:
         return self._file_obj.readline(limit)
 
@@ -83,6 +106,7 @@ class ReadableFile(IOReadable):
         except BaseException as err:
             logger.warn("ReadableProxyFile#close: on_close '%s' failed with '%s'", self._on_close, err)
         finally:
+            unmap_file(self._mmap)
             f.close()
 
     def __repr__(self):
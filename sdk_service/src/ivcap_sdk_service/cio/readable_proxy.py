@@ -4,24 +4,43 @@
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
 from builtins import BaseException
-from typing import IO, AnyStr, Callable, List, Optional
+from typing import IO, AnyStr, Callable, List, Mapping, Optional
+import shutil
 import tempfile
 import io
 
-from ivcap_sdk_service.cio.utils import download
+from ivcap_sdk_service.cio.utils import download, map_file, open_stream, unmap_file
 from ..logger import sys_logger as logger
 
 from .io_adapter import IOReadable, IOWritable
 
+# Size of chunks fetched from the remote stream when we need to look ahead
+STREAM_CHUNK_SIZE = 64 * 1024
+# Number of leading bytes kept in memory when streaming, so that a reader
+# can sniff the header of the content and seek back without a re-download
+REWIND_LIMIT = 1024 * 1024
+
 class ReadableProxy(IOReadable):
+    """
+    A readable on remote content.
+
+    If 'stream' is set and the content is binary, 'read' is served directly
+    from the HTTP response as the bytes arrive. The content is only spooled
+    into a local temp file when a reader seeks backwards beyond the rewind
+    buffer, seeks relative to the end, or asks for 'as_local_file'.
+
+    Otherwise, the entire content is downloaded into a local temp file
+    before the first read returns.
+    """
 
-    def __init__(self, 
+    def __init__(self,
         url: str,
         name=None,
-        on_close: Callable[[IO[bytes]], None]=None, 
-        is_binary=True, 
+        on_close: Callable[[IO[bytes]], None]=None,
+        is_binary=True,
         encoding=None,
-        cache: Optional[IOWritable] = None
+        cache: Optional[IOWritable] = None,
+        stream=False,
     ):
         self._name = name if name else url
         self._is_binary = is_binary
@@ -32,8 +51,16 @@ class ReadableProxy(IOReadable):
         self._cache = cache
         self._offset = 0
         self._file_obj = None
+        self._mmap = None
         self._closed = False
-    
+        self._headers = None
+        # streaming state - '_buf' holds the fetched bytes [_buf_start, _fetched)
+        self._stream = stream and is_binary
+        self._response = None
+        self._buf = bytearray()
+        self._buf_start = 0
+        self._fetched = 0
+
     @property
     def closed(self) -> bool:
         return self._closed
@@ -46,36 +73,72 @@ class ReadableProxy(IOReadable):
     def name(self) -> str:
         return self._name
 
+    @property
+    def headers(self) -> Optional[Mapping[str, str]]:
+        """Response headers of the remote content, once requested"""
+        return self._headers
+
     def as_local_file(self) -> str:
         self._get_file_obj()
         return self._path
 
+    def as_memoryview(self) -> memoryview:
+        """Return a memoryview on the entire content. Streamed content
+        is first spooled into a local file."""
+        if self._mmap == None:
+            self._mmap = map_file(self._get_file_obj())
+        return memoryview(self._mmap)
+
+    def prefetch(self) -> None:
+        """Fetch the content into a local file, or when streaming, open the
+        connection and fetch the first chunk"""
+        if self._is_streaming():
+            if self._fetched == 0:
+                self._fill(STREAM_CHUNK_SIZE)
+        else:
+            self._get_file_obj()
+
     def writable(self) -> bool:
         return self._writable_also
 
     def readable(self) -> bool:
         return True
-    
+
     def readline(self, limit: int = -1) -> AnyStr:
-        raise Exception("not implemented")
+        if self._is_streaming():
+            s = self._readline_stream(limit if limit != None else -1)
+        else:
+            s = self._get_file_obj().readline(limit)
+        self._tee(s)
+        return s
 
     def readlines(self, hint: int = -1) -> List[AnyStr]:
-        raise Exception("not implemented")
-
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if hint != None and 0 < hint <= total:
+                break
+        return lines
 
     def seek(self, offset, whence=io.SEEK_SET):
         """
         Change stream position by offset
         """
-        # if whence == io.SEEK_SET:
-        #     self._offset = offset
-        # elif whence == io.SEEK_CUR:
-        #     self._offset += offset
-        # else:
-        #     raise OSError(-1, "cannot seek from end")
-        self._get_file_obj().seek(offset, whence)
+        if self._is_streaming():
+            if whence == io.SEEK_SET or whence == io.SEEK_CUR:
+                target = offset if whence == io.SEEK_SET else self._offset + offset
+                if self._seek_stream(target):
+                    if self._cache:
+                        self._cache.seek(self._offset)
+                    return self._offset
+            # can't do that on the stream, fall back to local file
+            self._spool()
+        pos = self._get_file_obj().seek(offset, whence)
         if self._cache:
             self._cache.seek(offset, whence)
+        return pos
 
     def seekable(self) -> bool:
         return True
@@ -84,10 +147,39 @@ class ReadableProxy(IOReadable):
         """
         Return current stream position
         """
+        if self._is_streaming():
+            return self._offset
         return self._get_file_obj().tell()
 
     def read(self, n: int = -1) -> AnyStr:
-        s = self._get_file_obj().read(n)
+        if self._is_streaming():
+            s = self._read_stream(n)
+        else:
+            s = self._get_file_obj().read(n)
+        self._tee(s)
+        return s
+
+    def readinto(self, b) -> int:
+        return self._readinto(b, False)
+
+    def readinto1(self, b) -> int:
+        return self._readinto(b, True)
+
+    def _readinto(self, b, single: bool) -> int:
+        if not self._is_binary:
+            raise io.UnsupportedOperation("readinto - content is not binary")
+        m = memoryview(b).cast('B')
+        if self._is_streaming():
+            n = self._readinto_stream(m, single)
+        elif single:
+            n = self._get_file_obj().readinto1(m)
+        else:
+            n = self._get_file_obj().readinto(m)
+        self._tee(m[:n])
+        return n
+
+    def _tee(self, s):
+        """Pass content just read on to the cache writer, if there is one"""
         if self._cache:
             n = self._cache.write(s)
             if n != len(s):
@@ -98,19 +190,29 @@ class ReadableProxy(IOReadable):
                     pass
                 finally:
                     self._cache = None
-        return s
 
     def close(self):
         self._closed = True
- 
+
         if self._cache:
             try:
                 self._cache.close()
-            except:
+            except BaseException as err:
                 logger.warn("ReadableProxy#close: closing cache failed with '%s'", err)
             finally:
                 self._cache = None
 
+        if self._file_obj == None and self._stream:
+            # never spooled, nothing to clean up but the (possibly unopened) response
+            r = self._response
+            try:
+                if self._on_close and r:
+                    self._on_close(r.raw)
+            except BaseException as err:
+                logger.warn("ReadableProxyclose: on_close '%s' failed with '%s'", self._on_close, err)
+            finally:
+                self._close_response()
+            return
 
         f = self._get_file_obj()
         try:
@@ -119,14 +221,161 @@ class ReadableProxy(IOReadable):
         except BaseException as err:
             logger.warn("ReadableProxyclose: on_close '%s' failed with '%s'", self._on_close, err)
         finally:
+            unmap_file(self._mmap)
             f.close()
- 
+
+    def _is_streaming(self) -> bool:
+        return self._stream and self._file_obj == None
+
+    def _get_response(self):
+        if self._response == None:
+            self._response = open_stream(self._download_url)
+            self._set_headers(self._response.headers)
+            logger.debug("ReadableProxy#_get_response: Streaming external content '%s'", self._download_url)
+        return self._response
+
+    def _set_headers(self, headers: Mapping[str, str]):
+        first = self._headers == None
+        self._headers = headers
+        cacheID = headers.get('X-Cache-Id')
+        if cacheID and first:
+            self._name = f"{self._name} ({cacheID})"
+
+    def _close_response(self):
+        if self._response != None:
+            self._response.close()
+            self._response = None
+
+    def _fill(self, n: int) -> bool:
+        """Fetch up to 'n' more bytes from the remote stream into the buffer.
+        Return False if the stream is exhausted."""
+        chunk = self._get_response().raw.read(n)
+        if not chunk:
+            return False
+        self._buf += chunk
+        self._fetched += len(chunk)
+        return True
+
+    def _consume(self, n: int) -> bytes:
+        """Return up to 'n' (all if negative) buffered bytes from the current position"""
+        i = self._offset - self._buf_start
+        j = len(self._buf) if n < 0 else min(len(self._buf), i + n)
+        s = bytes(self._buf[i:j])
+        self._advance(len(s))
+        return s
+
+    def _advance(self, n: int):
+        self._offset += n
+        if self._offset > REWIND_LIMIT:
+            # outside the rewind window, only keep what hasn't been read yet
+            del self._buf[:self._offset - self._buf_start]
+            self._buf_start = self._offset
+
+    def _read_stream(self, n: int) -> bytes:
+        buffered = self._fetched - self._offset
+        if n < 0:
+            while self._fill(STREAM_CHUNK_SIZE):
+                pass
+            return self._consume(-1)
+        if buffered == 0 and self._offset > REWIND_LIMIT:
+            # nothing to rewind to anymore, hand out the remote bytes directly
+            del self._buf[:]
+            s = self._get_response().raw.read(n)
+            self._offset += len(s)
+            self._fetched = self._buf_start = self._offset
+            return s
+        while buffered < n and self._fill(max(n - buffered, STREAM_CHUNK_SIZE)):
+            buffered = self._fetched - self._offset
+        return self._consume(n)
+
+    def _readline_stream(self, limit: int) -> bytes:
+        start = self._offset - self._buf_start
+        searched = start
+        while True:
+            end = len(self._buf) if limit < 0 else min(len(self._buf), start + limit)
+            i = self._buf.find(b'\n', searched, end)
+            if i >= 0:
+                return self._consume(i + 1 - start)
+            if limit >= 0 and end - start >= limit:
+                return self._consume(limit)
+            searched = end
+            if not self._fill(STREAM_CHUNK_SIZE):
+                return self._consume(-1)
+
+    def _readinto_stream(self, m: memoryview, single: bool) -> int:
+        """Like '_read_stream' but fills 'm'. If 'single' is set, fetch from
+        the remote stream at most once."""
+        n = len(m)
+        buffered = self._fetched - self._offset
+        if buffered == 0 and self._offset > REWIND_LIMIT:
+            # nothing to rewind to anymore, read the remote bytes straight into 'm'
+            del self._buf[:]
+            raw = self._get_response().raw
+            k = raw.readinto(m)
+            while not single and 0 < k < n:
+                r = raw.readinto(m[k:])
+                if r == 0:
+                    break
+                k += r
+            self._offset += k
+            self._fetched = self._buf_start = self._offset
+            return k
+        while buffered < n and self._fill(max(n - buffered, STREAM_CHUNK_SIZE)):
+            buffered = self._fetched - self._offset
+            if single:
+                break
+        k = min(n, buffered)
+        i = self._offset - self._buf_start
+        m[:k] = self._buf[i:i + k]
+        self._advance(k)
+        return k
+
+    def _seek_stream(self, target: int) -> bool:
+        """Move the stream position to 'target'. Return False if that would
+        require going back to bytes no longer buffered."""
+        if target < self._buf_start:
+            return False
+        if target <= self._offset:
+            self._offset = target
+            return True
+        # skip forward by reading, the cache writer still needs the skipped bytes
+        while self._offset < target:
+            s = self._read_stream(min(target - self._offset, STREAM_CHUNK_SIZE))
+            if not s:
+                break
+            self._tee(s)
+        return True
+
+    def _spool(self):
+        """Switch from streaming to a local temp file holding the entire content."""
+        if self._buf_start > 0 or self._response == None:
+            # lost the head of the stream (or never started), start from scratch
+            self._close_response()
+            self._open_file_obj()
+        else:
+            self._file_obj = tempfile.NamedTemporaryFile("w+b")
+            self._path = self._file_obj.name
+            self._file_obj.write(self._buf)
+            try:
+                shutil.copyfileobj(self._response.raw, self._file_obj)
+            except BaseException as ex:
+                logger.error("ReadableProxy#_spool: While downloading - %s", ex.__repr__())
+                raise ex
+            finally:
+                self._close_response()
+            self._file_obj.flush()
+            logger.debug("ReadableProxy#_spool: Spooled external content '%s' into '%s'", self._download_url, self._path)
+        self._buf = bytearray()
+        self._file_obj.seek(self._offset)
 
     def _get_file_obj(self):
         if self._file_obj == None:
-            self._open_file_obj()
+            if self._stream:
+                self._spool()
+            else:
+                self._open_file_obj()
         return self._file_obj
-    
+
     def _open_file_obj(self):
         """Open and ensure that the local file object is properly "filled".
 
@@ -139,13 +388,12 @@ class ReadableProxy(IOReadable):
             self._file_obj = tempfile.NamedTemporaryFile(mode, encoding=self._encoding)
             self._path = self._file_obj.name
             try:
-                cacheID = download(self._download_url, self._file_obj, close_fhdl=False)
-                if cacheID:
-                    self._name = f"{self._name} ({cacheID})"
+                headers = download(self._download_url, self._file_obj, close_fhdl=False)
+                self._set_headers(headers)
             except BaseException as ex:
                 logger.error("ReadableProxy#_open_file_obj: While downloading - %s", ex.__repr__())
                 raise ex
-            
+
             logger.debug("ReadableProxy#_open_file_obj: Read external content '%s' into '%s'", self._download_url, self._path)
 
         elif self._path:
@@ -0,0 +1,114 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+A collection of artifacts listed by a (paged) artifact listing endpoint
+"""
+import os
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+from urllib.parse import quote, urljoin
+
+from ..logger import sys_logger as logger
+from .io_adapter import Collection, IOReadable
+from .prefetch import PrefetchIter
+from .utils import http_session
+
+# Number of artifacts requested per listing page
+COLLECTION_PAGE_SIZE = int(os.getenv('IVCAP_COLLECTION_PAGE_SIZE', 100))
+
+ArtifactItem = Dict[str, Any]
+
+class RemoteCollection(Collection):
+    """Iterates over the artifacts of a remote collection.
+
+    The listing at 'list_url' is fetched one page at a time, following the 'links.next'
+    reference of each page, and only when the iteration reaches it. Each entry of a page's
+    'artifacts' list is turned into a readable by 'open_item', with the next few items
+    opened concurrently ahead of the caller (see PrefetchIter). 'open_item' is called
+    with the item and the URL of the page listing it, which relative links of the item
+    are resolved against.
+
+    Args:
+        urn (str): Name of the collection
+        list_url (str): URL of the first page of the listing
+        open_item (Callable[[ArtifactItem, str], IOReadable]): Returns a readable for a listed artifact
+        items (Sequence[ArtifactItem], optional): Fixed list of items, instead of a listing
+    """
+
+    def __init__(self,
+        urn: str,
+        list_url: Optional[str],
+        open_item: Callable[[ArtifactItem, str], IOReadable],
+        items: Optional[Sequence[ArtifactItem]] = None,
+    ) -> None:
+        super().__init__()
+        self._urn = urn
+        self._list_url = list_url
+        self._open_item = open_item
+        self._fixed_items = items
+
+    @property
+    def name(self) -> str:
+        return self._urn
+
+    def __iter__(self) -> Iterator[IOReadable]:
+        if self._fixed_items != None:
+            items = ((item, self._list_url) for item in self._fixed_items)
+        else:
+            items = self._items()
+        return PrefetchIter(items, lambda listed: self._open_item(*listed))
+
+    def _items(self) -> Iterator[Tuple[ArtifactItem, str]]:
+        """Yield each listed item together with the URL of its page"""
+        url = self._list_url
+        while url:
+            logger.debug("RemoteCollection: fetch listing page '%s'", url)
+            r = http_session().get(url, headers={'Accept': 'application/json'})
+            if r.status_code >= 300:
+                raise Exception(f"error response {r.status_code} while listing collection '{self._urn}' via '{url}'")
+            page = r.json()
+            for item in page.get('artifacts', []):
+                yield (item, url)
+            next = (page.get('links') or {}).get('next')
+            url = urljoin(url, next) if next else None
+
+    def __repr__(self):
+        return f"<RemoteCollection urn={self._urn} list_url={self._list_url}>"
+
+def artifact_data_url(item: ArtifactItem, list_url: str) -> str:
+    """Return the URL of the content of an artifact listed at 'list_url'.
+
+    This is the item's 'data' link, if the listing includes one. Otherwise the
+    artifact's record is fetched from its 'self' link (or from the artifact
+    endpoint of the listing's storage service) to find the 'data' link there.
+
+    Args:
+        item (ArtifactItem): Entry of the listing's 'artifacts'
+        list_url (str): URL of the listing page containing 'item'
+
+    Raises:
+        ValueError: If the artifact has no content link
+    """
+    data_url = _data_link(item)
+    if not data_url:
+        record_url = (item.get('links') or {}).get('self')
+        if not record_url:
+            base = list_url.split('?')[0].rstrip('/')
+            record_url = f"{base}/{quote(item['id'], safe=':')}"
+        record_url = urljoin(list_url, record_url)
+        r = http_session().get(record_url, headers={'Accept': 'application/json'})
+        if r.status_code >= 300:
+            raise Exception(f"error response {r.status_code} while fetching artifact record '{record_url}'")
+        list_url = record_url
+        data_url = _data_link(r.json())
+    if not data_url:
+        raise ValueError(f"artifact '{item.get('id')}' has no content link")
+    return urljoin(list_url, data_url)
+
+def _data_link(record: Dict[str, Any]) -> Optional[str]:
+    data = record.get('data') or (record.get('links') or {}).get('data')
+    if isinstance(data, dict):
+        data = data.get('self')
+    return data
@@ -0,0 +1,174 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Resumable uploads following the TUS protocol (https://tus.io/protocols/resumable-upload)
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+from typing import BinaryIO, Dict, Optional, Set, Tuple
+from urllib.parse import urljoin
+import requests
+
+from ..itypes import UploadError
+from .utils import http_session
+from ..logger import sys_logger as logger
+
+TUS_VERSION = '1.0.0'
+
+UPLOAD_CHUNK_SIZE = int(os.getenv('IVCAP_UPLOAD_CHUNK_SIZE', 64 * 1024 * 1024))
+UPLOAD_PARALLEL = int(os.getenv('IVCAP_UPLOAD_PARALLEL', 1))
+UPLOAD_RETRIES = int(os.getenv('IVCAP_UPLOAD_RETRIES', 5))
+UPLOAD_RETRY_DELAY = float(os.getenv('IVCAP_UPLOAD_RETRY_DELAY', 2))
+
+class TusNotSupported(Exception):
+    """Raised when the server doesn't support the TUS protocol"""
+    pass
+
+class TusUploader:
+    """Uploads a file in chunks using the TUS protocol.
+
+    Before creating an upload, the server is asked (OPTIONS) which version and
+    extensions of the protocol it supports. Each chunk is sent with its own PATCH
+    request. If a request fails, the uploader asks the server how many bytes it has
+    received (HEAD) and continues from there. If 'parallel' is larger than 1 and the
+    server supports the 'concatenation' extension, the file is split into that many
+    parts which are uploaded concurrently and then joined on the server.
+
+    Args:
+        url (str): Creation URL
+        headers (Dict[str, str]): Additional headers for the creation request
+        chunk_size (int, optional): Size of a single PATCH request [IVCAP_UPLOAD_CHUNK_SIZE=64MB]
+        parallel (int, optional): Number of parts uploaded concurrently [IVCAP_UPLOAD_PARALLEL=1]
+        retries (int, optional): Number of retries after a failed request [IVCAP_UPLOAD_RETRIES=5]
+    """
+
+    def __init__(self,
+        url: str,
+        headers: Dict[str, str],
+        chunk_size: Optional[int] = None,
+        parallel: Optional[int] = None,
+        retries: Optional[int] = None,
+    ):
+        self._url = url
+        self._headers = headers
+        self._chunk_size = chunk_size if chunk_size else UPLOAD_CHUNK_SIZE
+        self._parallel = parallel if parallel else UPLOAD_PARALLEL
+        self._retries = retries if retries != None else UPLOAD_RETRIES
+        self._lock = threading.Lock()
+
+    def upload(self, fhdl: BinaryIO, size: int) -> requests.Response:
+        """Upload 'size' bytes of 'fhdl' and return the response to the creation
+        request, which describes the new artifact.
+
+        Raises:
+            TusNotSupported: If the server doesn't support the TUS protocol
+            UploadError: If the upload failed even after retrying
+        """
+        extensions = self._probe()
+        parallel = self._parallel
+        if parallel > 1 and not 'concatenation' in extensions:
+            logger.debug("TusUploader#upload: '%s' doesn't support concatenation, upload in one part", self._url)
+            parallel = 1
+        if parallel <= 1 or size < 2 * self._chunk_size:
+            r, upload_url = self._create(size, self._headers)
+            self._upload_range(fhdl, upload_url, 0, size)
+            return r
+
+        part_size = -(-size // parallel) # round up
+        parts = [(lo, min(lo + part_size, size)) for lo in range(0, size, part_size)]
+        partial = {'Upload-Concat': 'partial'}
+        def upload_part(part: Tuple[int, int]) -> str:
+            lo, hi = part
+            _, upload_url = self._create(hi - lo, partial)
+            self._upload_range(fhdl, upload_url, lo, hi)
+            return upload_url
+        logger.debug("TusUploader#upload: upload %d bytes to '%s' in %d parts", size, self._url, len(parts))
+        with ThreadPoolExecutor(max_workers=len(parts)) as ex:
+            part_urls = list(ex.map(upload_part, parts))
+        headers = dict(self._headers)
+        headers['Upload-Concat'] = 'final;' + ' '.join(part_urls)
+        r, _ = self._create(None, headers)
+        return r
+
+    def _probe(self) -> Set[str]:
+        """Return the protocol extensions supported by the server
+
+        Raises:
+            TusNotSupported: If the server doesn't support TUS version TUS_VERSION
+        """
+        r = self._request('options', self._url, headers={'Tus-Resumable': TUS_VERSION})
+        versions = [v.strip() for v in r.headers.get('Tus-Version', '').split(',')]
+        if r.status_code >= 300 or not TUS_VERSION in versions:
+            raise TusNotSupported(f"'{self._url}' doesn't seem to support TUS {TUS_VERSION}")
+        return set(e.strip() for e in r.headers.get('Tus-Extension', '').split(',') if e.strip())
+
+    def _create(self, size: Optional[int], headers: Dict[str, str]) -> Tuple[requests.Response, str]:
+        h = dict(headers)
+        h['Tus-Resumable'] = TUS_VERSION
+        if size != None:
+            h['Upload-Length'] = str(size)
+        r = self._request('post', self._url, headers=h)
+        if r.status_code >= 300:
+            raise UploadError(f"error response {r.status_code} while creating upload at '{self._url}'")
+        location = r.headers.get('Location')
+        if not r.headers.get('Tus-Resumable') or not location:
+            raise TusNotSupported(f"'{self._url}' doesn't seem to support TUS")
+        return (r, urljoin(self._url, location))
+
+    def _upload_range(self, fhdl: BinaryIO, upload_url: str, lo: int, hi: int):
+        """Upload bytes [lo, hi) of 'fhdl' to 'upload_url'. The upload's offset 0 corresponds to 'lo'"""
+        offset = 0
+        failures = 0
+        while lo + offset < hi:
+            n = min(self._chunk_size, hi - lo - offset)
+            chunk = self._read(fhdl, lo + offset, n)
+            headers = {
+                'Tus-Resumable': TUS_VERSION,
+                'Upload-Offset': str(offset),
+                'Content-Type': 'application/offset+octet-stream',
+            }
+            try:
+                r = http_session().patch(upload_url, data=chunk, headers=headers)
+                if r.status_code >= 300:
+                    raise UploadError(f"error response {r.status_code} while uploading to '{upload_url}'")
+                offset = int(r.headers.get('Upload-Offset', offset + n))
+                failures = 0
+            except Exception as err:
+                failures += 1
+                if failures > self._retries:
+                    raise UploadError(f"giving up on uploading to '{upload_url}' after {self._retries} retries - {err}")
+                delay = UPLOAD_RETRY_DELAY * 2 ** (failures - 1)
+                logger.warning("TusUploader: upload to '%s' failed at offset %d, resume in %.1fs - %s", upload_url, offset, delay, err)
+                time.sleep(delay)
+                offset = self._server_offset(upload_url, offset)
+
+    def _server_offset(self, upload_url: str, offset: int) -> int:
+        """Ask the server how much of the upload it already has"""
+        try:
+            r = http_session().head(upload_url, headers={'Tus-Resumable': TUS_VERSION})
+            if r.status_code < 300 and r.headers.get('Upload-Offset'):
+                return int(r.headers['Upload-Offset'])
+        except Exception as err:
+            logger.debug("TusUploader: cannot get offset of '%s' - %s", upload_url, err)
+        return offset
+
+    def _read(self, fhdl: BinaryIO, pos: int, n: int) -> bytes:
+        with self._lock:
+            fhdl.seek(pos)
+            return fhdl.read(n)
+
+    def _request(self, method: str, url: str, headers: Dict[str, str]) -> requests.Response:
+        failures = 0
+        while True:
+            try:
+                return http_session().request(method, url, headers=headers)
+            except requests.ConnectionError as err:
+                failures += 1
+                if failures > self._retries:
+                    raise UploadError(f"giving up on '{url}' after {self._retries} retries - {err}")
+                time.sleep(UPLOAD_RETRY_DELAY * 2 ** (failures - 1))
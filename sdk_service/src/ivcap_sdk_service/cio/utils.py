@@ -4,20 +4,102 @@
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha256
+import mmap
+import os
 import re
-from typing import BinaryIO
+import threading
+from typing import BinaryIO, Dict, Mapping, Optional, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from ..logger import sys_logger as logger
 from ..itypes import Url
 
-def download(url: Url, fhdl: BinaryIO, chunk_size=None, close_fhdl=True) -> str:
-    cacheID = None
-    with requests.get(url, stream=True) as r:
+# Content larger than a single part is fetched as concurrent byte ranges
+DOWNLOAD_PART_SIZE = int(os.getenv('IVCAP_DOWNLOAD_PART_SIZE', 8 * 1024 * 1024))
+DOWNLOAD_WORKERS = int(os.getenv('IVCAP_DOWNLOAD_WORKERS', 4))
+
+# Max number of kept-alive connections per host
+HTTP_POOL_SIZE = int(os.getenv('IVCAP_HTTP_POOL_SIZE', 16))
+# Retries for failed connections and idempotent requests answered with 502-504
+HTTP_RETRIES = int(os.getenv('IVCAP_HTTP_RETRIES', 3))
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+def http_session() -> requests.Session:
+    """Return the HTTP session shared by all network requests of this process.
+
+    Connections are kept alive and pooled (IVCAP_HTTP_POOL_SIZE per host), and failed
+    connection attempts as well as idempotent requests answered with a 502, 503 or 504
+    are retried (IVCAP_HTTP_RETRIES) with an exponential backoff.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if not _SESSION:
+            retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSION = session
+        return _SESSION
+
+def _reset_session():
+    # pooled connections must not be shared with a forked child
+    global _SESSION, _SESSION_LOCK
+    _SESSION = None
+    _SESSION_LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_session)
+
+def download(
+    url: Url,
+    fhdl: BinaryIO,
+    chunk_size=None,
+    close_fhdl=True,
+    part_size: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Mapping[str, str]:
+    """Download the content of 'url' into 'fhdl' and return the response headers.
+
+    If 'fhdl' is a binary file, the server supports range requests, and the content
+    is larger than 'part_size', the content is fetched as 'part_size' ranges by
+    'workers' concurrent requests directly into a preallocated file. Otherwise,
+    or if that fails, the content is fetched through a single stream.
+
+    Args:
+        url (Url): URL to download
+        fhdl (BinaryIO): File to write content to
+        chunk_size (int, optional): Chunk size when streaming. Defaults to None.
+        close_fhdl (bool, optional): Close 'fhdl' when done. Defaults to True.
+        part_size (int, optional): Size of a range. Defaults to IVCAP_DOWNLOAD_PART_SIZE [8MB].
+        workers (int, optional): Number of concurrent range requests. Defaults to IVCAP_DOWNLOAD_WORKERS [4].
+
+    Returns:
+        Mapping[str, str]: The (case insensitive) response headers
+    """
+    part_size = part_size if part_size else DOWNLOAD_PART_SIZE
+    workers = workers if workers else DOWNLOAD_WORKERS
+    if workers > 1 and _is_binary_file(fhdl):
+        done, headers = _download_ranges(url, fhdl, part_size, workers)
+        if done:
+            if close_fhdl:
+                fhdl.close()
+            return headers
+
+    with http_session().get(url, stream=True) as r:
         r.raise_for_status()
         ct = r.headers.get('Content-Type')
-        cacheID = r.headers.get('X-Cache-Id')
+        headers = r.headers
         logger.debug(f"cio#download: request {r} - {ct} - {r.headers}")
 
         # if ct:
@@ -34,10 +116,124 @@ def download(url: Url, fhdl: BinaryIO, chunk_size=None, close_fhdl=True) -> str:
     fhdl.flush()
     if close_fhdl:         
         fhdl.close()
-    return cacheID
+    return headers
+
+def _download_ranges(url: Url, fhdl: BinaryIO, part_size: int, workers: int) -> Tuple[bool, Optional[Mapping[str, str]]]:
+    try:
+        h = http_session().head(url, allow_redirects=True)
+        h.raise_for_status()
+    except BaseException as ex:
+        logger.debug("cio#download: HEAD '%s' failed - %s", url, ex)
+        return (False, None)
+    size = int(h.headers.get('Content-Length', -1))
+    encoding = h.headers.get('Content-Encoding', 'identity')
+    if h.headers.get('Accept-Ranges') != 'bytes' or size <= part_size or encoding != 'identity':
+        return (False, None)
+
+    # make sure all ranges come from the same version of the content
+    validator = h.headers.get('ETag', h.headers.get('Last-Modified'))
+    fhdl.flush()
+    fd = fhdl.fileno()
+    base = fhdl.tell()
+    os.ftruncate(fd, base + size)
+
+    def fetch(lo: int, hi: int):
+        # ranges of an encoded representation can't be stitched together
+        headers = {'Range': f"bytes={lo}-{hi}", 'Accept-Encoding': 'identity'}
+        if validator:
+            headers['If-Range'] = validator
+        with http_session().get(h.url, headers=headers, stream=True) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise Exception(f"expected partial content, but got '{r.status_code}'")
+            pos = base + lo
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                _pwrite(fd, chunk, pos)
+                pos += len(chunk)
+            if pos != base + hi + 1:
+                raise Exception(f"incomplete range {lo}-{hi}")
+
+    logger.debug("cio#download: fetching '%s' (%d bytes) in %d byte ranges", url, size, part_size)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            parts = [ex.submit(fetch, lo, min(lo + part_size, size) - 1) for lo in range(0, size, part_size)]
+            for p in parts:
+                try:
+                    p.result()
+                except BaseException as err:
+                    for p2 in parts:
+                        p2.cancel()
+                    raise err
+    except BaseException as err:
+        logger.warning("cio#download: range download of '%s' failed, fall back to single stream - %s", url, err)
+        os.ftruncate(fd, base)
+        fhdl.seek(base)
+        return (False, None)
+    fhdl.seek(base + size)
+    return (True, h.headers)
+
+_pwrite_lock = threading.Lock()
+
+def _pwrite(fd: int, data: bytes, offset: int):
+    mv = memoryview(data)
+    if hasattr(os, 'pwrite'):
+        while mv:
+            n = os.pwrite(fd, mv, offset)
+            mv = mv[n:]
+            offset += n
+    else:
+        with _pwrite_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while mv:
+                n = os.write(fd, mv)
+                mv = mv[n:]
+
+def _is_binary_file(fhdl) -> bool:
+    if 'b' not in getattr(fhdl, 'mode', ''):
+        return False
+    try:
+        fhdl.fileno()
+        return True
+    except BaseException:
+        return False
+
+def open_stream(url: Url, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    """Return an open, streaming response for 'url'.
+
+    The body is not fetched until it is read from 'response.raw'. The
+    caller is responsible for closing the response.
+    """
+    r = http_session().get(url, headers=headers, stream=True)
+    try:
+        r.raise_for_status()
+    except BaseException as ex:
+        r.close()
+        raise ex
+    # let urllib3 undo any transfer compression while streaming
+    r.raw.decode_content = True
+    logger.debug(f"cio#open_stream: request {r} - {r.headers.get('Content-Type')} - {r.headers}")
+    return r
+
+def map_file(fhdl) -> Union[mmap.mmap, bytes]:
+    """Map the content of the open file 'fhdl' read-only into memory"""
+    fhdl.flush()
+    if os.fstat(fhdl.fileno()).st_size == 0:
+        return b'' # empty files can't be mapped
+    return mmap.mmap(fhdl.fileno(), 0, access=mmap.ACCESS_READ)
+
+def unmap_file(m: Optional[Union[mmap.mmap, bytes]]):
+    """Release a mapping returned by 'map_file'. If memoryviews on it are still
+    in use, the mapping is released once the last of them is garbage collected."""
+    if isinstance(m, mmap.mmap):
+        try:
+            m.close()
+        except BufferError:
+            pass
 
 def get_cache_name(url: Url) -> str:
-    name = re.search('.*/([^/]+)', url)[1]
+    """Return the name of the file caching the content of 'url'"""
+    m = re.search('.*[/:]([^/:]+)', url)
+    name = m[1] if m else url
     encoded_name = f"{sha256(url.encode('utf-8')).hexdigest()}-{name}"
     return encoded_name
 
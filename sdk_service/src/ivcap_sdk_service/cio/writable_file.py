@@ -7,6 +7,7 @@ from builtins import BaseException
 from typing import IO, Any, AnyStr, Callable, List, Optional
 import tempfile
 import io
+import os
 from ..logger import sys_logger as logger
 
 from .io_adapter import IOWritable
@@ -34,6 +35,7 @@ class WritableFile(IOWritable):
         use_temp_file=False,
     ):
         mode = "wb" if is_binary else "w"
+        self._use_temp_file = use_temp_file
         if use_temp_file:
             self._file_obj = tempfile.NamedTemporaryFile(mode, encoding=encoding) # delete after uploaded
             self._name = self._file_obj.name
@@ -106,5 +108,17 @@ class WritableFile(IOWritable):
         finally:
             self._file_obj.close()
 
+    def abort(self):
+        """Remove the file without calling 'on_close'"""
+        if self._closed:
+            return
+        self._closed = True
+        self._file_obj.close()
+        if not self._use_temp_file:
+            try:
+                os.remove(self._name)
+            except OSError as err:
+                logger.warning("WritableFile#abort: cannot remove '%s' - %s", self._name, err)
+
     def __repr__(self):
         return f"<WritableFile name={self._name} closed={self._closed} mode={self._mode} fp={self._file_obj}>"
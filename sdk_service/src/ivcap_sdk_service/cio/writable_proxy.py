@@ -3,26 +3,80 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
+import base64
 from builtins import BaseException
-import collections
-import sys
-from typing import AnyStr, Callable, List, Optional, Sequence, Union
+import collections.abc
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import queue
+import threading
+from typing import AnyStr, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 import tempfile
 import io
 import requests
-from ivcap_sdk_service.cio.utils import encode64
+from ivcap_sdk_service.cio.utils import encode64, http_session
 
-from ivcap_sdk_service.itypes import MetaDict, SupportedMimeTypes
+from ivcap_sdk_service.itypes import MetaDict, SupportedMimeTypes, UploadError
 from ivcap_sdk_service.utils import json_dump
 from ..logger import sys_logger as logger
 
 from .io_adapter import IOWritable
+from . import tus
+from .compression import compress_chunks, compress_file, upload_encoding
+from .dedup import DedupIndex
+
+# When streaming, content is sent in chunks of this size ...
+STREAM_CHUNK_SIZE = 1024 * 1024
+# ... and at most this many chunks are held in memory before 'write' blocks
+STREAM_MAX_CHUNKS = 8
+# Content is only streamed once it grows beyond that many bytes, smaller content is
+# uploaded in a single request. Set to 0 to always stream.
+STREAM_MIN_SIZE = int(os.getenv('IVCAP_UPLOAD_STREAM_MIN_SIZE', 8 * 1024 * 1024))
+
+# Number of metadata records of an artifact posted concurrently
+METADATA_WORKERS = int(os.getenv('IVCAP_METADATA_WORKERS', 4))
+
+_METADATA_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_METADATA_LOCK = threading.Lock()
+
+def _metadata_executor() -> ThreadPoolExecutor:
+    global _METADATA_EXECUTOR
+    with _METADATA_LOCK:
+        if not _METADATA_EXECUTOR:
+            _METADATA_EXECUTOR = ThreadPoolExecutor(METADATA_WORKERS, thread_name_prefix='metadata')
+        return _METADATA_EXECUTOR
+
+def _reset_metadata_executor():
+    # threads of the parent don't exist in a forked child
+    global _METADATA_EXECUTOR, _METADATA_LOCK
+    _METADATA_EXECUTOR = None
+    _METADATA_LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_metadata_executor)
 
 class WritableProxy(IOWritable):
     """
     A class which implements the IOWritable interface for writing data. It additionally
     persists the data on disk.
 
+    If 'is_seekable' is set, all content is first written to a local temp file and
+    uploaded on 'close'. Files larger than IVCAP_UPLOAD_CHUNK_SIZE are uploaded in
+    resumable chunks using the TUS protocol (set it to 0 to disable). Otherwise,
+    content is held in memory until it grows beyond IVCAP_UPLOAD_STREAM_MIN_SIZE, after
+    which it is streamed to 'storage_url' while it is being written, using chunked
+    transfer encoding from a bounded in-memory pipe. 'abort' discards the content and
+    fails an upload which is already streaming.
+
+    If 'dedup' is given, content is always written to a temp file and its SHA-256 is
+    looked up in this index. Content already uploaded under the same name, mime type
+    and 'collection_name' isn't uploaded again. Its metadata is still posted for the
+    existing artifact, whose ID is passed to 'on_close'.
+
+    Compressible content is gzip or zstd encoded on the way if IVCAP_UPLOAD_COMPRESSION
+    is set (see 'compression.upload_encoding').
+
     ...
 
     Args:
@@ -33,16 +87,19 @@ class WritableProxy(IOWritable):
         encoding (_type_, optional): _description_. Defaults to None.
     """
 
-    def __init__(self, 
+    def __init__(self,
         storage_url: str,
-        mime_type: str, 
+        mime_type: str,
         metadata: Optional[Union[MetaDict, Sequence[MetaDict]]] = None,
         name: Optional[str] = None,
         is_seekable=False,
-        on_close: Optional[Callable[[str, str], str]]=None, 
+        on_close: Optional[Callable[[str, str], str]]=None,
         encoding=None,
+        dedup: Optional[DedupIndex] = None,
+        collection_name: Optional[str] = None,
     ):
         self._storage_url = storage_url
+        self._collection_name = collection_name
         if isinstance(mime_type, SupportedMimeTypes):
             mime_type = mime_type.value
         is_binary = not mime_type.startswith('text')
@@ -50,11 +107,23 @@ class WritableProxy(IOWritable):
         self._mime_type = mime_type
         self._name = name if name else "???"
         self._metadata = metadata
+        self._encoding = encoding if encoding else 'utf-8'
+        self._is_binary = is_binary
 
-        # At this stage, we first write it to a local temp file and on close, post the file
-        # to 'url'
-        mode = "w+b" if is_binary else "w+"
-        self._file_obj = tempfile.NamedTemporaryFile(mode, encoding=encoding) # delete after uploaded
+        self._file_obj = None
+        self._pipe = None
+        self._buf = None # content not streamed yet
+        self._dedup = dedup
+        # SHA-256 of the content as long as it is written sequentially
+        self._hasher = hashlib.sha256() if dedup and is_binary else None
+        if is_seekable or dedup:
+            # content needs to be hashed before deciding to upload it.
+            # At this stage, we first write it to a local temp file and on close, post the file
+            # to 'url'
+            mode = "w+b" if is_binary else "w+"
+            self._file_obj = tempfile.NamedTemporaryFile(mode, encoding=encoding) # delete after uploaded
+        else:
+            self._buf = bytearray()
         self.cnt = 0
         self._on_close = on_close
         self._closed = False
@@ -75,32 +144,53 @@ class WritableProxy(IOWritable):
         """
         Change stream position by offset
         """
+        if not self._file_obj:
+            raise io.UnsupportedOperation("seek - writable is not seekable")
         diff = offset - self.cnt
         self.cnt += diff
+        self._hasher = None
         self._file_obj.seek(offset, whence)
 
     def seekable(self) -> bool:
-        return True
+        return self._file_obj != None
 
     def tell(self) -> int:
         """
         Return current stream position
         """
+        if not self._file_obj:
+            return self.cnt
         stream_pos = self._file_obj.tell()
         return stream_pos
 
     def write(self, bytes_obj: AnyStr) -> int:
-        bytes_written = self._file_obj.write(bytes_obj)
+        if not self._file_obj:
+            b = bytes_obj if isinstance(bytes_obj, (bytes, bytearray, memoryview)) else bytes_obj.encode(self._encoding)
+            if self._pipe:
+                self._pipe.write(b)
+            else:
+                self._buf += b
+                if len(self._buf) > STREAM_MIN_SIZE:
+                    self._start_streaming()
+            bytes_written = len(bytes_obj)
+        else:
+            bytes_written = self._file_obj.write(bytes_obj)
+            if self._hasher:
+                self._hasher.update(bytes_obj)
         self.cnt += bytes_written
         return bytes_written
 
     def writelines(self, lines: List[AnyStr]) -> None:
-        self._file_obj.writelines(lines)
+        for l in lines:
+            self.write(l)
 
     def writable(self) -> bool:
         return True
 
     def truncate(self, size: int = None) -> int:
+        if not self._file_obj:
+            raise io.UnsupportedOperation("truncate - writable is not seekable")
+        self._hasher = None
         self.cnt = self._file_obj.truncate(size)
         return self.cnt
 
@@ -108,33 +198,160 @@ class WritableProxy(IOWritable):
         return False
 
     def flush(self) -> None:
-        self._file_obj.flush()
+        if self._file_obj:
+            self._file_obj.flush()
 
     def close(self):
         self._closed = True
-        url = self._upload()
+        try:
+            url = self._upload()
+        finally:
+            if self._file_obj:
+                self._file_obj.close()
         try:
             if self._on_close:
                 self._on_close(url, self._name)
         except BaseException as err:
             logger.warning("WritableProxy#close: on_close '%s' failed with '%s'", self._on_close, err)
+
+    def abort(self):
+        """Discard the content without creating an artifact"""
+        if self._closed:
+            return
+        self._closed = True
+        logger.info("Abort artifact '%s'", self._name)
+        self._buf = None
+        try:
+            if self._pipe:
+                self._pipe.abort()
         finally:
-            self._file_obj.close()
+            if self._file_obj:
+                self._file_obj.close()
+
+    def _start_streaming(self):
+        """Stream the content written so far, and all further content"""
+        headers, _ = self._upload_headers()
+        encoding = upload_encoding(self._mime_type)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        logger.info("Stream artifact '%s'", self._name)
+        self._pipe = _UploadPipe(lambda data: self._post(compress_chunks(data, encoding) if encoding else data, headers))
+        buf, self._buf = self._buf, None
+        self._pipe.write(buf)
 
     def _upload(
-        self, 
+        self,
     ) -> str:
-        fd = self._file_obj
-        logger.info("Upload artifact '%s'", self._name)
-        fd.flush()
-        fd.seek(0)
+        headers, metadataUploaded = self._upload_headers()
+        digest = None
+        if self._pipe:
+            try:
+                r = self._pipe.close()
+            except BaseException as err:
+                raise UploadError(f"while streaming result data to '{self._storage_url}' - {err}")
+        elif self._buf != None:
+            logger.info("Upload artifact '%s'", self._name)
+            data = bytes(self._buf)
+            encoding = upload_encoding(self._mime_type, len(data))
+            if encoding:
+                data = b''.join(compress_chunks(iter([data]), encoding))
+                headers['Content-Encoding'] = encoding
+            try:
+                r = self._post(data, headers)
+            except BaseException as err:
+                raise UploadError(f"while posting result data to '{self._storage_url}' - {err}")
+        else:
+            fd = self._file_obj
+            logger.info("Upload artifact '%s'", self._name)
+            fd.flush()
+            with ExitStack() as stack:
+                bfd = stack.enter_context(open(fd.name, 'rb'))
+                size = os.fstat(bfd.fileno()).st_size
+                if self._dedup:
+                    digest = self._digest(bfd)
+                    uploaded = self._dedup.lookup(digest, self._name, self._mime_type, self._collection_name)
+                    if uploaded:
+                        artifactID, url = uploaded
+                        logger.info(f"WritableProxy: content of '{self._name}' already uploaded as '{artifactID}'")
+                        # none of the metadata has been sent with an upload
+                        metadata = self._metadata_list()
+                        if len(metadata) > 0:
+                            self._upload_metadata(metadata, artifactID, url)
+                        return artifactID
+                encoding = upload_encoding(self._mime_type, size)
+                if encoding:
+                    cfd = stack.enter_context(tempfile.TemporaryFile())
+                    csize = compress_file(bfd, cfd, encoding)
+                    logger.debug("WritableProxy: compressed '%s' from %d to %d bytes (%s)", self._name, size, csize, encoding)
+                    headers['Content-Encoding'] = encoding
+                    bfd, size = cfd, csize
+                    bfd.seek(0)
+                if digest:
+                    # the index is keyed by the content, the header describes the bytes sent
+                    sent = _sha256(bfd) if encoding else digest
+                    headers['Digest'] = 'sha-256=' + base64.b64encode(bytes.fromhex(sent)).decode('ascii')
+                try:
+                    if tus.UPLOAD_CHUNK_SIZE > 0 and size > tus.UPLOAD_CHUNK_SIZE:
+                        r = self._resumable_upload(bfd, size, headers)
+                    else:
+                        r = self._post(bfd, headers)
+                except UploadError:
+                    raise
+                except BaseException as err:
+                    raise UploadError(f"while posting result data to '{self._storage_url}' - {err}")
+        if r.status_code >= 300:
+            raise UploadError(f"error response {r.status_code} while posting result data to '{self._storage_url}'")
+
+        try:
+            j = r.json()
+        except ValueError as err:
+            raise UploadError(f"unexpected response while posting result data to '{self._storage_url}' - {err}")
+        size = j.get('size')
+        artifactID = j.get('id')
+        if not artifactID:
+            artifactID = r.headers.get('X-Artifact-Id')
+        logger.info(f"WritableProxy: created artifact '{artifactID}' of size '{size}' via '{self._storage_url}'")
+
+        metadata = self._metadata_list()
+        url = r.headers.get('Location')
+        if not metadataUploaded and len(metadata) > 0:
+            self._upload_metadata(metadata, artifactID, url)
+        if self._dedup and digest:
+            self._dedup.add(digest, self._name, self._mime_type, artifactID, url, self._collection_name)
+        return artifactID
+
+    def _digest(self, fd) -> str:
+        """Return the SHA-256 of the content. Only reads 'fd' if the content
+        wasn't written sequentially."""
+        if self._hasher:
+            return self._hasher.hexdigest()
+        return _sha256(fd)
+
+    def _resumable_upload(self, fd, size: int, headers: Dict[str, str]) -> requests.Response:
+        """Upload 'fd' in chunks which can be resumed after a failure. Falls back
+        to a single POST if the server doesn't support the TUS protocol."""
+        # the creation request has no body for a 'Digest' to describe
+        tus_headers = {k: v for k, v in headers.items() if k != 'Digest'}
+        try:
+            return tus.TusUploader(self._storage_url, tus_headers).upload(fd, size)
+        except tus.TusNotSupported as err:
+            logger.warning("WritableProxy: resumable upload not available, use single request - %s", err)
+            fd.seek(0)
+            return self._post(fd, headers)
 
+    def _metadata_list(self) -> Sequence[MetaDict]:
         metadata = self._metadata
         if metadata:
-            if not isinstance(metadata, collections.Sequence):
+            if not isinstance(metadata, collections.abc.Sequence):
                 metadata = [metadata]
         else:
             metadata = []
+        return metadata
+
+    def _upload_headers(self) -> Tuple[Dict[str, str], bool]:
+        """Return the headers for uploading the content, and if
+        all the metadata is already included in those headers"""
+        metadata = self._metadata_list()
         metadataUploaded = False
 
         # dataType = str(type(self.dataPeek))
@@ -149,53 +366,126 @@ class WritableProxy(IOWritable):
             # Immediately upload simple metadata
             metadataUploaded = True
             headers['Upload-Metadata'] = ','. join(map(lambda e: f"{e[0]} {encode64(str(e[1]))}", metadata[0].items()))
-        try:
-            logger.debug("Post artifact data='%s', headers:'%s'", fd, headers)
-            r = requests.post(self._storage_url, data=fd, headers=headers)
-        except:
-            print(">>>>", sys.exc_info())
-            logger.fatal(f"while posting result data {self._storage_url} - {sys.exc_info()[0]}")
-            sys.exit(-1)
-        if r.status_code >= 300:
-            logger.fatal(f"error response {r.status_code} while posting result data {self._storage_url}")
-            sys.exit(-1)
+        return (headers, metadataUploaded)
 
-        j = r.json()
-        size = j['size']
-        artifactID = j['id']
-        if not artifactID:
-            artifactID = r.headers.get('X-Artifact-Id')
-        logger.info(f"WritableProxy: created artifact '{artifactID}' of size '{size}' via '{self._storage_url}'")
-
-        if not metadataUploaded and len(metadata) > 0:
-            url = r.headers.get('Location')
-            self._upload_metadata(metadata, artifactID, url)
-        return artifactID
+    def _post(self, data, headers: Dict[str, str]) -> requests.Response:
+        logger.debug("Post artifact data='%s', headers:'%s'", data, headers)
+        return http_session().post(self._storage_url, data=data, headers=headers)
 
     def _upload_metadata(
-        self, 
+        self,
         metadata: Sequence[MetaDict],
         artifactID: str,
         url: str,
     ) -> None:
-        for md in metadata:
-            headers = {
-                "X-Meta-Data-For-Url": url,
-                "X-Meta-Data-For-Artifact": artifactID,
-                "X-Meta-Data-Schema": md.get('$schema', '???'),
-                "Content-Type": "application/json",
-            }
-            try:
-                logger.debug("Post artifact metadata data='%s', headers:'%s'", md, headers)
-                payload = json_dump(md)
-                r = requests.post(self._storage_url, data=payload, headers=headers)
-            except:
-                logger.fatal(f"while posting metadata {self._storage_url} - {sys.exc_info()}")
-                sys.exit(-1)
-            if r.status_code >= 300:
-                logger.fatal(f"error response {r.status_code} while posting metadata {self._storage_url}")
-                sys.exit(-1)
+        """Post all metadata records for 'artifactID'. Multiple records are
+        posted concurrently (IVCAP_METADATA_WORKERS) over the shared session."""
+        if len(metadata) == 1:
+            self._post_metadata(metadata[0], artifactID, url)
+            return
+        futures = [_metadata_executor().submit(self._post_metadata, md, artifactID, url) for md in metadata]
+        errors = [f.exception() for f in futures if f.exception()]
+        if errors:
+            raise errors[0]
+
+    def _post_metadata(self, md: MetaDict, artifactID: str, url: str) -> None:
+        headers = {
+            "X-Meta-Data-For-Url": url,
+            "X-Meta-Data-For-Artifact": artifactID,
+            "X-Meta-Data-Schema": md.get('$schema', '???'),
+            "Content-Type": "application/json",
+        }
+        try:
+            logger.debug("Post artifact metadata data='%s', headers:'%s'", md, headers)
+            payload = json_dump(md)
+            r = http_session().post(self._storage_url, data=payload, headers=headers)
+        except BaseException as err:
+            raise UploadError(f"while posting metadata to '{self._storage_url}' - {err}")
+        if r.status_code >= 300:
+            raise UploadError(f"error response {r.status_code} while posting metadata to '{self._storage_url}'")
 
     def __repr__(self):
-        return f"<WritableProxy name={self._name} closed={self._closed} fp={self._file_obj}>"
+        fp = self._file_obj if self._file_obj else self._pipe
+        return f"<WritableProxy name={self._name} closed={self._closed} fp={fp}>"
 
+def _sha256(fd) -> str:
+    """Return the SHA-256 of the rest of 'fd' and rewind it"""
+    h = hashlib.sha256()
+    for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+        h.update(chunk)
+    fd.seek(0)
+    return h.hexdigest()
+
+_ABORT = object() # sentinel failing the upload
+
+class _UploadPipe:
+    """Feeds the bytes written to it to an upload running in a background thread.
+
+    Writes are collected into chunks of STREAM_CHUNK_SIZE and at most STREAM_MAX_CHUNKS
+    chunks are queued, after which 'write' blocks until the upload catches up.
+    'abort' breaks off the request, so the server never sees a complete body.
+    """
+
+    def __init__(self, post: Callable[[Iterator[bytes]], requests.Response]):
+        self._queue = queue.Queue(maxsize=STREAM_MAX_CHUNKS)
+        self._buf = bytearray()
+        self._response = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(post,), daemon=True)
+        self._thread.start()
+
+    def write(self, b: bytes):
+        self._buf += b
+        while len(self._buf) >= STREAM_CHUNK_SIZE:
+            self._put(bytes(self._buf[:STREAM_CHUNK_SIZE]))
+            del self._buf[:STREAM_CHUNK_SIZE]
+
+    def close(self) -> requests.Response:
+        """Send what's left, wait for the upload to finish and return its response"""
+        if self._buf:
+            self._put(bytes(self._buf))
+            self._buf = bytearray()
+        self._put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+        return self._response
+
+    def abort(self):
+        """Fail the upload and wait for it to finish"""
+        self._buf = bytearray()
+        try:
+            self._put(_ABORT)
+        except Exception:
+            pass # upload has already failed or finished
+        self._thread.join()
+
+    def _put(self, chunk: Optional[bytes]):
+        while True:
+            if self._error:
+                raise self._error
+            if not self._thread.is_alive():
+                raise Exception("upload finished before all content was sent")
+            try:
+                self._queue.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def _chunks(self) -> Iterator[bytes]:
+        while True:
+            chunk = self._queue.get()
+            if chunk == None:
+                return
+            if chunk is _ABORT:
+                raise UploadError("upload aborted")
+            yield chunk
+
+    def _run(self, post: Callable[[Iterator[bytes]], requests.Response]):
+        try:
+            self._response = post(self._chunks())
+        except BaseException as err:
+            self._error = err
+
+    def __repr__(self):
+        return f"<_UploadPipe queued={self._queue.qsize()}>"
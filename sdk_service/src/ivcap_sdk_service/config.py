@@ -4,16 +4,20 @@
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
 import base64
+import copy
 from dataclasses import dataclass
 import os
+import re
 from argparse import ArgumentParser, ArgumentTypeError
 from pathlib import Path
-from typing import MutableSequence, Callable, Dict
+from typing import TYPE_CHECKING, MutableSequence, Callable, Dict, Optional
 import sys
+import threading
 
 from enum import Enum, auto
 
-from .cio import IOAdapter, LocalIOAdapter, IvcapIOAdapter, Cache
+if TYPE_CHECKING:
+    from .cio import IOAdapter, Cache
 
 INSIDE_CONTAINER = not not os.getenv('IVCAP_INSIDE_CONTAINER', None) # make it a bool
 INSIDE_ARGO = not not os.getenv('ARGO_NODE_ID', None) # make it a bool
@@ -26,10 +30,13 @@ DEF_SCHEMA_PREFIX = 'urn:ivcap:'
 
 SUPPORTED_PROTOCOLS = ['httpserver', 'opendap']
 
+_LAZY_LOCK = threading.RLock()
+
 class Command(Enum):
     SERVICE_RUN = auto()
     SERVICE_HELP = auto()
     SERVICE_FILE = auto()
+    SERVICE_WORKER = auto()
 
 class Resource(Enum):
     ORDER = 'order'
@@ -43,16 +50,16 @@ class Config:
   ORDER_ID: str
   NODE_ID: str
 
-  IO_ADAPTER: IOAdapter
-  CACHE: Cache
   CACHE_PROXY_URL: str
   STORAGE_URL: str
+  IN_DIR: str
   OUT_DIR: str
 
   SCHEMA_PREFIX: str
 
   SERVICE_ARGS: MutableSequence[str]
   SERVICE_COMMAND: Command = Command.SERVICE_RUN
+  WORKER_SOURCE: str = None
 
 
   def __init__(self, argv:Dict[str, str] = None, modify_ap: Callable[[ArgumentParser], ArgumentParser] = None):
@@ -81,33 +88,75 @@ class Config:
         self.SERVICE_COMMAND = Command.SERVICE_HELP
     elif args.pop('ivcap:print_service_description', False):
         self.SERVICE_COMMAND = Command.SERVICE_FILE
+    self.WORKER_SOURCE = args.pop('ivcap:worker', None)
+    if self.WORKER_SOURCE and self.SERVICE_COMMAND == Command.SERVICE_RUN:
+        self.SERVICE_COMMAND = Command.SERVICE_WORKER
 
     self.ORDER_ID = args.pop('ivcap:order_id', order_id_def)
     self.NODE_ID = args.pop('ivcap:node_id', node_id_def)
 
     self.CACHE_PROXY_URL = args.pop('ivcap:cache_proxy', None)
-    cacheDir = args.pop('ivcap:cache_dir', None)
-    if cacheDir != '':
-        self.CACHE = Cache(cache_dir=cacheDir)
-    else:
-        self.CACHE = None
+    self._cache_dir = args.pop('ivcap:cache_dir', None)
+    self._cache_max_bytes = args.pop('ivcap:cache_max_bytes', None)
+    self._cache = None
 
     self.STORAGE_URL = args.pop('ivcap:storage_url', None)
-    in_dir = args.pop('ivcap:in_dir', None)
+    self.IN_DIR = args.pop('ivcap:in_dir', None)
     self.OUT_DIR = args.pop('ivcap:out_dir', DEF_OUT_DIR)
+    self._io_adapter = None
+
+    self.SCHEMA_PREFIX = args.pop('ivcap:schema_prefix', None)
+
+  # The cache and IO adapter are only created when first used, so commands like
+  # printing the service description don't load the 'cio' package
+
+  @property
+  def CACHE(self) -> Optional['Cache']:
+    with _LAZY_LOCK:
+      if self._cache == None and self._cache_dir != '':
+        from .cio import Cache
+        max_bytes = self._cache_max_bytes
+        if max_bytes == None and os.getenv('IVCAP_CACHE_MAX_BYTES'):
+          max_bytes = verify_size(os.getenv('IVCAP_CACHE_MAX_BYTES'))
+        self._cache = Cache(cache_dir=self._cache_dir, max_bytes=max_bytes)
+      return self._cache
+
+  @property
+  def IO_ADAPTER(self) -> 'IOAdapter':
+    with _LAZY_LOCK:
+      if self._io_adapter == None:
+        self._io_adapter = self._create_io_adapter()
+      return self._io_adapter
+
+  @IO_ADAPTER.setter
+  def IO_ADAPTER(self, adapter: 'IOAdapter'):
+    self._io_adapter = adapter
+
+  def _create_io_adapter(self) -> 'IOAdapter':
+    from .cio import LocalIOAdapter, IvcapIOAdapter
     if self.STORAGE_URL:
-      self.IO_ADAPTER = IvcapIOAdapter(
+      return IvcapIOAdapter(
         storage_url = self.STORAGE_URL,
-        in_dir = in_dir,
+        in_dir = self.IN_DIR,
         out_dir = self.OUT_DIR,
         order_id=self.ORDER_ID,
         cache = self.CACHE,
         cachable_url = self.cachable_url,
        )
     else:
-      self.IO_ADAPTER = LocalIOAdapter(in_dir=in_dir, out_dir=self.OUT_DIR, cache_dir=cacheDir)
-
-    self.SCHEMA_PREFIX = args.pop('ivcap:schema_prefix', None)
+      return LocalIOAdapter(in_dir=self.IN_DIR, out_dir=self.OUT_DIR, cache=self.CACHE)
+
+  def for_order(self, order_id: str, out_dir: Optional[str] = None) -> 'Config':
+    """Return a copy of this config for processing order 'order_id' with its own
+    IO adapter. The cache is shared with this config."""
+    c = copy.copy(self)
+    c.ORDER_ID = order_id
+    if out_dir:
+      c.OUT_DIR = out_dir
+    c.SERVICE_COMMAND = Command.SERVICE_RUN
+    c._cache = self.CACHE # shared
+    c._io_adapter = None
+    return c
 
   def add_arguments(self, ap):
     order_id_def = os.getenv('IVCAP_ORDER_ID')
@@ -122,11 +171,13 @@ class Config:
             cache_dir_def = DEF_CACHE_DIR
         else:
             cache_dir_def = os.path.join(os.getcwd(), 'cache')
+    cache_max_bytes_def=os.getenv('IVCAP_CACHE_MAX_BYTES')
     cache_proxy_def=os.getenv('IVCAP_CACHE_URL')
 
     schema_prefix_def = os.getenv('IVCAP_SCHEMA_PREFIX', DEF_SCHEMA_PREFIX)
 
     storage_url_def = os.getenv('IVCAP_STORAGE_URL', None)
+    worker_def = os.getenv('IVCAP_WORKER', None)
 
     ap.add_argument("-H", "--ivcap:service-help",
         action='store_true',
@@ -155,6 +206,10 @@ class Config:
     ap.add_argument("--ivcap:cache-dir", metavar="DIR", 
         help=f"Directory to locally cache files [IVCAP_CACHE_DIR={cache_dir_def}]",
         default=cache_dir_def)
+    ap.add_argument("--ivcap:cache-max-bytes", metavar="SIZE", 
+        help=f"Max. size of local cache, e.g. 500M or 20G [IVCAP_CACHE_MAX_BYTES={cache_max_bytes_def}]",
+        default=None, # IVCAP_CACHE_MAX_BYTES is only checked when the cache is created
+        type=verify_size)
     ap.add_argument("--ivcap:cache-proxy", metavar="URL", 
         help=f"Cache proxy url [IVCAP_CACHE_PROXY={cache_proxy_def}]",
         default=cache_proxy_def)
@@ -167,6 +222,10 @@ class Config:
         help=f"Schema prefix to use [IVCAP_SCHEMA_PREFIX={schema_prefix_def}]",
         default=schema_prefix_def)
 
+    ap.add_argument("--ivcap:worker", metavar="SOURCE",
+        help=f"Keep running and process orders read as JSON lines from stdin ('-') or as JSON files from a directory [IVCAP_WORKER={worker_def}]",
+        default=worker_def)
+
     ap.add_argument("--print-config",
         action='store_true',
         help="Print config settings and exit")      
@@ -204,6 +263,15 @@ def verify_dir(dname):
   else:
       raise ArgumentTypeError(f"Can't find directory '{dname}'")
 
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def verify_size(size):
+  m = re.fullmatch(r'\s*(\d+)\s*([KMGT]?)B?\s*', str(size), re.IGNORECASE)
+  if m:
+    return int(m[1]) * _SIZE_UNITS[m[2].upper()]
+  else:
+    raise ArgumentTypeError(f"Can't parse size '{size}' - expected something like '1024', '500M', or '20G'")
+
 def verify_protocol(fname):
   if fname.lower() in SUPPORTED_PROTOCOLS:
     return fname.lower()
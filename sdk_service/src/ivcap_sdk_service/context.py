@@ -0,0 +1,59 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Context of the order currently processed, so several orders can be processed
+concurrently in one process (in threads or asyncio tasks).
+
+The context is held in a 'contextvars.ContextVar'. Asyncio tasks inherit it
+automatically, threads of an executor don't. Use 'wrap' for functions submitted
+to an executor.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+if TYPE_CHECKING:
+    from .config import Config
+
+T = TypeVar('T')
+
+@dataclass(eq=False)
+class OrderContext:
+    """Everything specific to one order"""
+    config: 'Config'
+    delivered: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def order_id(self) -> str:
+        return self.config.ORDER_ID
+
+_CURRENT: ContextVar[Optional[OrderContext]] = ContextVar('ivcap_order', default=None)
+
+def current_order() -> Optional[OrderContext]:
+    """Return the context of the current order, or None outside of 'order_context'"""
+    return _CURRENT.get()
+
+@contextmanager
+def order_context(config: 'Config') -> Iterator[OrderContext]:
+    """Make 'config' the config of the current order until the block is left.
+
+    Args:
+        config (Config): Config of the order, see 'Config.for_order'
+    """
+    ctx = OrderContext(config)
+    token = _CURRENT.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _CURRENT.reset(token)
+
+def wrap(fn: Callable[..., T]) -> Callable[..., T]:
+    """Return a function calling 'fn' in a copy of the caller's context, e.g. for
+    submitting it to an executor. The returned function can't be run concurrently
+    with itself, so wrap 'fn' for every submission."""
+    ctx = copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
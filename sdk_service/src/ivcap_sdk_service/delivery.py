@@ -0,0 +1,130 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Runs the delivery (serialisation and upload) of results, optionally in the background
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from .context import OrderContext, current_order, wrap
+from .logger import sys_logger as logger
+
+# Number of results uploaded concurrently in the background. '0' delivers synchronously
+DELIVERY_WORKERS = int(os.getenv('IVCAP_DELIVERY_WORKERS', 0))
+# Max number of results waiting to be uploaded before 'submit' blocks
+DELIVERY_MAX_PENDING = int(os.getenv('IVCAP_DELIVERY_MAX_PENDING', 8))
+
+class DeliveryExecutor:
+    """Executes deliveries on a small pool of threads.
+
+    At most 'max_pending' deliveries can be in flight (queued or running). Further calls to
+    'submit' block until one of them finishes, which stops a fast producer from buffering
+    an unbounded number of results in memory.
+
+    Args:
+        workers (int, optional): Number of threads. 0 runs deliveries synchronously [IVCAP_DELIVERY_WORKERS=0]
+        max_pending (int, optional): Number of deliveries in flight [IVCAP_DELIVERY_MAX_PENDING=8]
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self._workers = workers if workers != None else DELIVERY_WORKERS
+        max_pending = max_pending if max_pending else DELIVERY_MAX_PENDING
+        self._slots = threading.BoundedSemaphore(max(max_pending, self._workers, 1))
+        self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix='deliver') if self._workers > 0 else None
+        self._pending: List[Tuple[Optional[OrderContext], Future]] = []
+        self._errors: List[Tuple[Optional[OrderContext], BaseException]] = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[], None], name: str) -> Future:
+        """Run 'fn' in the background and return a future for its completion.
+
+        'fn' runs in the context (see 'context.current_order') of the caller. If deliveries
+        are synchronous, 'fn' is called immediately and any error it raises is passed on
+        to the caller.
+        """
+        if not self._executor:
+            f = Future()
+            fn()
+            f.set_result(None)
+            return f
+
+        owner = current_order()
+        self._slots.acquire()
+        try:
+            f = self._executor.submit(wrap(fn))
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.append((owner, f))
+        f.add_done_callback(lambda f: self._done(f, name, owner))
+        return f
+
+    def track(self, f: Future, name: str):
+        """Record a delivery running elsewhere, e.g. in an asyncio task, which completes 'f'.
+        'drain' then also waits for it and reports its error."""
+        owner = current_order()
+        with self._lock:
+            self._pending.append((owner, f))
+        f.add_done_callback(lambda f: self._done(f, name, owner, has_slot=False))
+
+    def drain(self) -> List[BaseException]:
+        """Wait for all deliveries submitted by the current order to finish and return
+        the errors of those which failed since the last call. Outside of an order
+        context, this waits for all deliveries."""
+        owner = current_order()
+        mine = lambda o: owner is None or o is owner
+        errors = []
+        while True:
+            with self._lock:
+                pending = [f for o, f in self._pending if mine(o)]
+                self._pending = [(o, f) for o, f in self._pending if not mine(o)]
+            if not pending:
+                break
+            for f in pending:
+                if f.exception():
+                    errors.append(f.exception())
+        with self._lock:
+            errors = [err for o, err in self._errors if mine(o)] + errors
+            self._errors = [(o, err) for o, err in self._errors if not mine(o)]
+        return errors
+
+    def _done(self, f: Future, name: str, owner: Optional[OrderContext], has_slot=True):
+        if has_slot:
+            self._slots.release()
+        err = f.exception()
+        with self._lock:
+            if (owner, f) in self._pending:
+                # not yet collected by 'drain'
+                self._pending.remove((owner, f))
+                if err:
+                    self._errors.append((owner, err))
+        if err:
+            logger.error("Delivery of '%s' failed - %s", name, err)
+
+_EXECUTOR: Optional[DeliveryExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def get_executor() -> DeliveryExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if not _EXECUTOR:
+            _EXECUTOR = DeliveryExecutor()
+        return _EXECUTOR
+
+def _reset_executor():
+    # threads of the parent don't exist in a forked child
+    global _EXECUTOR, _EXECUTOR_LOCK
+    _EXECUTOR = None
+    _EXECUTOR_LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+def drain_deliveries() -> List[BaseException]:
+    """Wait for all pending deliveries and return the errors of the failed ones"""
+    return get_executor().drain()
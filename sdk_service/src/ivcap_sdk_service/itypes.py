@@ -32,3 +32,7 @@ class UnsupportedMimeType(Exception):
     def __init__(self, mime_type: str):
         self.mime_type = mime_type
 
+class UploadError(Exception):
+    """Raised when result data or metadata could not be uploaded"""
+    pass
+
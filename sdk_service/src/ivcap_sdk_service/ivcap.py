@@ -8,7 +8,8 @@ from __future__ import annotations
 # Helper funtions to interface with CSE services
 #
 from argparse import ArgumentParser
-from typing import Callable, Dict, Any, Optional, Sequence, Union, cast
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Optional, Sequence, Union, cast
 from urllib.parse import urlparse
 
 #from .utils import json_dump
@@ -17,11 +18,13 @@ from .cio.io_adapter import IOAdapter, IOReadable, IOWritable, OnCloseF
 
 from .logger import sys_logger as logger
 from .config import Config, Resource
+from .context import current_order
+from .delivery import get_executor
 from .itypes import MetaDict, SupportedMimeTypes, Url, MissingParameterValue, UnsupportedMimeType
 
 SCHEMA_KEY = '$schema'
 
-DELIVERED = []
+DELIVERED = [] # outside of an order context, see 'get_delivered'
 _CONFIG: Config = None # only use internally and only after calling init()
 
 SaverF = Callable[[
@@ -51,7 +54,7 @@ def deliver_data(
     metadata: Optional[Union[MetaDict, Sequence[MetaDict]]] = None, 
     seekable=False,
     on_close: Optional[OnCloseF] = None
-):
+) -> Future:
     """Deliver a result of this service
 
     Args:
@@ -64,30 +67,32 @@ def deliver_data(
         seekable (bool, optional): If true, writable should be seekable (needed for NetCDF). Defaults to False.
         on_close (Optional[Callable[[Url]]], optional): Called with assigned artifact ID. Defaults to None.
 
+    By default, the data is written and uploaded before this call returns. If
+    IVCAP_DELIVERY_WORKERS is set, that happens in the background instead, so
+    'data_or_lambda' must not be modified after this call. All pending deliveries are
+    then completed before the service exits.
+
     Raises:
         NotImplementedError: Raised when no saver function is defined for 'type'
 
     Returns:
-        None
+        Future: Completes when the result has been uploaded
     """
 
-    global DELIVERED
-
-    def _on_close(url):
-        mt = mime_type.value if isinstance(mime_type, SupportedMimeTypes) else mime_type
-        m = dict(name=name, url=url, mime_type=mt, meta=metadata)
-        DELIVERED.append(m)
-        notify(m, _CONFIG.SCHEMA_PREFIX + 'deliver')
-        if on_close:
-            on_close(url)
-
+    _on_close = _on_delivered(name, mime_type, metadata, on_close)
     if callable(data_or_lambda):
         l = cast(Callable[[IOWritable], None],  data_or_lambda)
         if not mime_type:
             raise MissingParameterValue('mime_type')
-        fhdl: IOWritable = get_config().IO_ADAPTER.write_artifact(mime_type, name, collection_name, metadata, seekable, _on_close)
-        l(fhdl)
-        fhdl.close()
+        io_adapter = get_config().IO_ADAPTER
+        def deliver():
+            fhdl: IOWritable = io_adapter.write_artifact(mime_type, name, collection_name, metadata, seekable, _on_close)
+            try:
+                l(fhdl)
+            except BaseException as ex:
+                fhdl.abort()
+                raise ex
+            fhdl.close()
     else: 
         data = data_or_lambda
         if not mime_type:
@@ -97,11 +102,31 @@ def deliver_data(
                 raise NotImplementedError(f"Cannot resolve mime-type for '{cls}'")
 
         sf = _MIME_TYPE2SAVER.get(mime_type)
-        if sf:
-            sf(name, data, get_config().IO_ADAPTER, 
-            collection_name=collection_name, metadata=metadata, seekable=seekable, on_close=_on_close)
-        else:
+        if not sf:
             raise UnsupportedMimeType(mime_type)
+        io_adapter = get_config().IO_ADAPTER
+        def deliver():
+            sf(name, data, io_adapter, 
+            collection_name=collection_name, metadata=metadata, seekable=seekable, on_close=_on_close)
+    return get_executor().submit(deliver, name)
+
+def _on_delivered(
+    name: str,
+    mime_type: Union[str, SupportedMimeTypes],
+    metadata: Optional[Union[MetaDict, Sequence[MetaDict]]],
+    on_close: Optional[OnCloseF],
+) -> OnCloseF:
+    """Return the callback recording a delivered result once its upload is complete"""
+    delivered = get_delivered()
+    schema_prefix = get_config().SCHEMA_PREFIX
+    def _on_close(url):
+        mt = mime_type.value if isinstance(mime_type, SupportedMimeTypes) else mime_type
+        m = dict(name=name, url=url, mime_type=mt, meta=metadata)
+        delivered.append(m)
+        notify(m, schema_prefix + 'deliver')
+        if on_close:
+            on_close(url)
+    return _on_close
 
 def register_saver(mime_type: str, obj_type: Any, saverF: SaverF):
     """Register a 'saver' function used in 'deliver' for a specific data type.
@@ -183,7 +208,15 @@ def notify(msg, schema=None):
         logger.debug(f"Notify {json_dump(msg)}")
 
 def get_config() -> Config:
-    return _CONFIG
+    """Returns the config of the current order (see 'context.order_context')
+    or, outside of an order context, the one created by 'init'"""
+    ctx = current_order()
+    return ctx.config if ctx else _CONFIG
+
+def get_delivered() -> List[Dict[str, Any]]:
+    """Returns the records of the results delivered so far by the current order"""
+    ctx = current_order()
+    return ctx.delivered if ctx else DELIVERED
 
 
 #### Initialize
@@ -0,0 +1,157 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Process the items of a collection in parallel
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import multiprocessing
+import os
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from .cio.io_adapter import IOReadable
+from .cio.prefetch import PrefetchIter
+from .cio.readable_file import ReadableFile
+from .context import wrap
+from .delivery import drain_deliveries
+from .logger import sys_logger as logger
+from . import ivcap
+
+# Number of workers used by 'map_collection'
+MAP_WORKERS = int(os.getenv('IVCAP_MAP_WORKERS', os.cpu_count() or 1))
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+def map_collection(
+    fn: Callable[[T], R],
+    collection: Iterable[T],
+    workers: Optional[int] = None,
+    executor: str = 'thread',
+    ordered: bool = True,
+    max_pending: Optional[int] = None,
+) -> Iterator[R]:
+    """Call 'fn' on every item of 'collection' using a pool of workers and
+    yield the results.
+
+    The default 'thread' executor runs 'fn' in threads of this process, which suits I/O
+    bound work and code releasing the GIL (e.g. numpy). With the 'process' executor, each
+    item is processed in a forked child process, so 'fn' and its results need to be
+    picklable. Readables in the collection are passed to the child as a local file which
+    is opened again there. Results delivered with 'deliver_data' inside 'fn' are uploaded
+    before the item counts as done, and are recorded with the parent's order. Forking
+    a process which runs other threads (e.g. background deliveries or prefetching)
+    can deadlock a child if one of them holds a lock at that moment, so only use
+    'process' for CPU bound work in a service which doesn't. Platforms without 'fork'
+    always use threads.
+
+    Readable items are closed after 'fn' has processed them. This is a generator, so
+    nothing is processed until it is iterated, e.g. 'for _ in map_collection(...): pass'.
+
+    Args:
+        fn (Callable[[T], R]): Function called with each item
+        collection (Iterable[T]): Items to process, e.g. a Collection parameter
+        workers (int, optional): Number of workers [IVCAP_MAP_WORKERS=#cpus]
+        executor (str, optional): Either 'thread' or 'process'. Defaults to 'thread'.
+        ordered (bool, optional): Yield results in the order of the items. Otherwise yield them
+            as they complete. Defaults to True.
+        max_pending (int, optional): Max number of items submitted but not yet yielded. Defaults to 2 * workers.
+
+    Raises:
+        ValueError: For an unknown 'executor'
+        Exception: The first error raised by 'fn' stops the iteration and is passed on
+
+    Yields:
+        R: The results of 'fn'
+    """
+    workers = workers if workers else MAP_WORKERS
+    max_pending = max_pending if max_pending else 2 * workers
+    if executor == 'process' and 'fork' not in multiprocessing.get_all_start_methods():
+        logger.warning("map_collection: 'fork' is not supported on this platform, use threads instead")
+        executor = 'thread'
+    if executor == 'process':
+        pool: Executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+        submit = lambda item: pool.submit(_run_in_child, fn, _to_picklable(item))
+    elif executor == 'thread':
+        pool = ThreadPoolExecutor(workers, thread_name_prefix='map')
+        submit = lambda item: pool.submit(wrap(fn), item)
+    else:
+        raise ValueError(f"Unknown executor '{executor}' - expected 'process' or 'thread'")
+
+    pending: Deque[Tuple[Future, T]] = deque()
+    items = iter(collection)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((submit(item), item))
+            if not pending:
+                return
+            if ordered:
+                f, item = pending.popleft()
+                f.exception() # wait
+            else:
+                done, _ = wait([f for f, _ in pending], return_when=FIRST_COMPLETED)
+                f, item = next(p for p in pending if p[0] in done)
+                pending.remove((f, item))
+            _close(item)
+            yield _result(f, executor)
+    finally:
+        for f, item in pending:
+            f.cancel()
+            _close(item)
+        if isinstance(items, PrefetchIter):
+            # release the items opened ahead when stopping early
+            items.close()
+        pool.shutdown(wait=True)
+
+def _result(f: Future, executor: str) -> Any:
+    if executor == 'thread':
+        return f.result()
+    result, delivered = f.result()
+    ivcap.get_delivered().extend(delivered)
+    return result
+
+def _close(item: Any):
+    if isinstance(item, IOReadable):
+        try:
+            item.close()
+        except BaseException as err:
+            logger.warning("map_collection: closing '%s' failed - %s", item, err)
+
+class _LocalFileRef:
+    """Stands in for a readable when passed to a child process"""
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+
+def _to_picklable(item: Any) -> Any:
+    if isinstance(item, IOReadable):
+        return _LocalFileRef(item.name, item.as_local_file())
+    return item
+
+def _run_in_child(fn: Callable[[Any], Any], item: Any) -> Tuple[Any, List[Dict]]:
+    """Process 'item' in a worker process and return the result together with
+    the records of all artifacts delivered meanwhile"""
+    if isinstance(item, _LocalFileRef):
+        item = ReadableFile(item.name, item.path)
+    # the child inherited the context of the parent's thread
+    del ivcap.get_delivered()[:]
+    try:
+        result = fn(item)
+    finally:
+        _close(item)
+        errors = drain_deliveries()
+    if errors:
+        raise errors[0]
+    delivered = list(ivcap.get_delivered())
+    del ivcap.get_delivered()[:]
+    return (result, delivered)
@@ -4,28 +4,35 @@
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
 
+import inspect
 import os
 import sys
 import time
-import requests
 
-from typing import Dict, Callable, Sequence, Dict
-from argparse import ArgumentParser, ArgumentError
+from typing import Dict, Callable, Optional, Sequence, Dict
+from argparse import ArgumentParser, ArgumentError, ArgumentTypeError
 from collections import namedtuple
 # import traceback
 
 from .ivcap import init, get_config
+from .delivery import drain_deliveries
 from .logger import logger, sys_logger 
 from .service import Service
+from .verifiers import ParameterResolver
+from .worker import run_worker
 from .config import Command, INSIDE_ARGO, INSIDE_CONTAINER
 
 def run(args: Dict, handler: Callable[[Dict], int]) -> int:
     sys_logger.info(f"Starting service with '{args}'")
-    code = handler(args, logger)
+    if inspect.iscoroutinefunction(handler):
+        import asyncio
+        code = asyncio.run(handler(args, logger))
+    else:
+        code = handler(args, logger)
     return code
 
 def _print_banner(service: Service):
-    from .__init__ import __version__
+    from . import __version__
     sdk_v = os.getenv('IVCAP_SDK_VERSION', __version__)
     sdk_c = os.getenv('IVCAP_SDK_COMMIT', '#?')
     svc_v = os.getenv('IVCAP_SERVICE_VERSION', '?')
@@ -46,11 +53,12 @@ def register_service(service: Service, handler: Callable[[Dict], int]):
     if cmd == Command.SERVICE_RUN:
         if not INSIDE_ARGO:
             _print_banner(service)
-        wait_for_data_proxy()
         cfg = get_config()
         sys_logger.info(f"Starting order '{cfg.ORDER_ID}' for service '{service.name}' on node '{cfg.NODE_ID}'")
         try:
-            code = run_service(service, cfg.SERVICE_ARGS, handler)
+            code = run_service(service, cfg.SERVICE_ARGS, handler, wait_for=wait_for_data_proxy)
+            if not complete_deliveries() and code == 0:
+                code = -1
             sys.exit(code)
         except ArgumentError as perr:
             sys_logger.fatal(f"arg error '{perr}'")
@@ -58,7 +66,21 @@ def register_service(service: Service, handler: Callable[[Dict], int]):
             sys_logger.exception(err)
             # sys_logger.error(f"Unexpected {err}, {type(err)}")
             # sys_logger.debug(traceback.format_exc())
+            complete_deliveries()
             sys.exit(-1)
+    elif cmd == Command.SERVICE_WORKER:
+        if not INSIDE_ARGO:
+            _print_banner(service)
+        wait_for_data_proxy()
+        def run_order(args: Sequence[str]) -> int:
+            try:
+                code = run_service(service, args, handler)
+            finally:
+                delivered = complete_deliveries()
+            return code if delivered or code != 0 else -1
+        sys_logger.info(f"Waiting for orders for service '{service.name}' from '{get_config().WORKER_SOURCE}'")
+        failed = run_worker(get_config().WORKER_SOURCE, run_order)
+        sys.exit(0 if failed == 0 else -1)
     elif cmd == Command.SERVICE_FILE:
         print(service.to_yaml())
     elif cmd == Command.SERVICE_HELP:
@@ -69,6 +91,13 @@ def register_service(service: Service, handler: Callable[[Dict], int]):
         sys_logger.error(f"Unexpected command '{cmd}'")
 
 
+def complete_deliveries() -> bool:
+    """Wait for all results still being delivered. Returns False if any of them failed"""
+    errors = drain_deliveries()
+    if errors:
+        sys_logger.error(f"{len(errors)} result(s) could not be delivered")
+    return len(errors) == 0
+
 def wait_for_data_proxy():
     if not INSIDE_ARGO:
         return
@@ -77,24 +106,42 @@ def wait_for_data_proxy():
     retries = int(os.getenv('IVCAP_DATA_PROXY_RETRIES', 5))
     delay = int(os.getenv('IVCAP_DATA_PROXY_DELAY', 3))
 
+    # a single request per attempt, the shared session would retry on its own
+    import requests
     for _ in range(retries):
         sys_logger.info(f"Checking for data-proxy at '{url}'.")
         try:
-            requests.head(url)
+            requests.head(url, timeout=delay)
             return
         except Exception:
             sys_logger.info(f"Data-proxy doesn't seem to be ready yet, will wait {delay}sec and try again.")
             time.sleep(delay)
     raise Exception(f"Can't contact data-proxy after {retries} retries on '{url}'")
 
-def run_service(service: Service, args: Sequence[str], handler: Callable[[Dict], int]) -> int:
+def run_service(
+    service: Service,
+    args: Sequence[str],
+    handler: Callable[[Dict], int],
+    wait_for: Optional[Callable[[], None]] = None,
+) -> int:
+    """Parse 'args' and call 'handler' with them.
+
+    Artifact and collection parameters are resolved (and prefetched) concurrently,
+    while 'wait_for' (e.g. waiting for the data proxy) is running.
+    """
     ap = ArgumentParser(description=service.description)
     # Need to wait for 3.10
     # ap = ArgumentParser(description=service.description, exit_on_error=False)
     service.append_arguments(ap)
     pargs = ap.parse_args(args)
-    args = vars(pargs)
+    resolver = ParameterResolver(vars(pargs))
+    if wait_for:
+        wait_for()
+    try:
+        args = resolver.result(retry_failed=wait_for != None)
+    except ArgumentTypeError as err:
+        # report it like any other illegal argument (exits with 2)
+        ap.error(str(err))
     ST = namedtuple('ServiceArgs', args.keys())
     at = ST(**args)
     return run(at, handler)
-    
\ No newline at end of file
@@ -14,7 +14,11 @@ def xa_dataset_saver(name: str, data: Any, io_adapter: IOAdapter, **kwargs):
     xmeta['@schema'] = 'urn:schema:xarray'
     _append_meta(kwargs, xmeta)
     fhdl: IOWritable = io_adapter.write_artifact(SupportedMimeTypes.NETCDF, f"{name}.nc", **kwargs)
-    data.to_netcdf(fhdl, compute=True)
+    try:
+        data.to_netcdf(fhdl, compute=True)
+    except BaseException as ex:
+        fhdl.abort()
+        raise ex
     fhdl.close()
 
 def png_pil_saver(name: str, img: Any, io_adapter: IOAdapter, **kwargs):
@@ -33,7 +37,11 @@ def _pil_saver(name: str, img: Any, mtype: SupportedMimeTypes, format: str, io_a
         'format': format,
     })
     fhdl: IOWritable = io_adapter.write_artifact(mtype, f"{name}.{format}", **kwargs)
-    img.save(fhdl, format="png")
+    try:
+        img.save(fhdl, format="png")
+    except BaseException as ex:
+        fhdl.abort()
+        raise ex
     fhdl.close()
 
 def _append_meta(kwargs, meta):
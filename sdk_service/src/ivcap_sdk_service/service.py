@@ -9,14 +9,12 @@ from dataclasses import dataclass, field
 from dataclass_wizard import JSONWizard, json_field
 from argparse import ArgumentParser
 from typing import List, Any
-import yaml
 from enum import Enum
 import os
 
 from typing import Dict
 
 from .verifiers import verify_artifact, verify_collection, ArtifactAction, CollectionAction
-from .utils import read_yaml_no_dates
 
 @dataclass
 class Option:
@@ -152,6 +150,7 @@ class Service(JSONWizard):
 
     @classmethod
     def from_file(cls, serviceFile: str) -> None:
+        from .utils import read_yaml_no_dates
         pd = read_yaml_no_dates(serviceFile)
         return cls.from_dict(pd)
 
@@ -163,6 +162,7 @@ class Service(JSONWizard):
         return d
 
     def to_yaml(self) -> str:
+        import yaml
         return yaml.dump(self.to_dict(), default_flow_style=False)
 
     def append_arguments(self, ap: ArgumentParser) -> ArgumentParser:
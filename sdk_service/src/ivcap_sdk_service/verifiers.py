@@ -4,18 +4,28 @@
 # found in the LICENSE file. See the AUTHORS file for names of contributors.
 #
 from __future__ import annotations
+from abc import ABC, abstractmethod
 from argparse import Action, ArgumentTypeError
-import yaml
-import validators
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+from typing import Any, Dict, Optional
 
 from .ivcap import get_config
 from .config import Resource, INSIDE_CONTAINER
+from .cio.io_adapter import Collection, IOReadable
+from .context import wrap
+from .logger import sys_logger as logger
+
+# Number of artifact and collection parameters resolved concurrently
+PARAM_WORKERS = int(os.getenv('IVCAP_PARAM_WORKERS', 8))
 
 # TODO: Add verifying code
 def verify_artifact(urn):
     if is_valid_resource_urn(urn, Resource.ARTIFACT):
         return urn
 
+    import validators # slow to import
+
     if INSIDE_CONTAINER:
         if not validators.url(urn):
             raise ArgumentTypeError(f"Illegal artifact reference '{urn}' - expected url")
@@ -28,13 +38,31 @@ def verify_artifact(urn):
             raise ArgumentTypeError(f"Cannot find local file '{urn}' - {get_config().IO_ADAPTER}")
         return urn
 
+class ResourceRef(ABC):
+    """A reference to an artifact or collection parameter which has not been resolved yet"""
+    def __init__(self, urn: str):
+        self.urn = urn
+
+    @abstractmethod
+    def resolve(self) -> Any:
+        pass
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} urn={self.urn}>"
+
+class ArtifactRef(ResourceRef):
+    def resolve(self) -> IOReadable:
+        r = get_config().IO_ADAPTER.read_artifact(self.urn)
+        r.prefetch()
+        return r
+
+class CollectionRef(ResourceRef):
+    def resolve(self) -> Collection:
+        return get_config().IO_ADAPTER.get_collection(self.urn)
+
 class ArtifactAction(Action):
     def __call__(self, _1, namespace, value, _2=None):
-        try:
-            v = get_config().IO_ADAPTER.read_artifact(value)
-            setattr(namespace, self.dest, v)
-        except Exception as err:
-            raise ArgumentTypeError(err)
+        setattr(namespace, self.dest, ArtifactRef(value))
 
 def verify_collection(urn):
     if is_valid_resource_urn(urn, Resource.COLLECTION):
@@ -53,12 +81,65 @@ def verify_collection(urn):
 
 class CollectionAction(Action):
     def __call__(self, _1, namespace, value, _2=None):
+        setattr(namespace, self.dest, CollectionRef(value))
+
+class ParameterResolver:
+    """Resolves all artifact and collection references among the parsed service
+    arguments concurrently in the background, starting right away.
+
+    Args:
+        args (Dict[str, Any]): Parsed service arguments
+        workers (int, optional): Max number of references resolved concurrently [IVCAP_PARAM_WORKERS=8]
+    """
+
+    def __init__(self, args: Dict[str, Any], workers: Optional[int] = None):
+        self._args = args
+        self._refs = {k: v for k, v in args.items() if isinstance(v, ResourceRef)}
+        self._futures: Dict[str, Future] = {}
+        self._executor = None
+        if self._refs:
+            workers = min(workers if workers else PARAM_WORKERS, len(self._refs))
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix='params')
+            self._futures = {k: self._executor.submit(wrap(r.resolve)) for k, r in self._refs.items()}
+
+    def result(self, retry_failed=False) -> Dict[str, Any]:
+        """Wait for all references to be resolved and return the arguments with the
+        references replaced by readables and collections.
+
+        Args:
+            retry_failed (bool, optional): Resolve failed references once more, e.g. if they
+                were started before the data proxy was ready. Defaults to False.
+
+        Raises:
+            ArgumentTypeError: If a reference cannot be resolved
+        """
+        args = dict(self._args)
+        futures = list(self._futures.values())
         try:
-            v = get_config().IO_ADAPTER.get_collection(value)
-            setattr(namespace, self.dest, v)
-        except Exception as err:
-            raise ArgumentTypeError(err)
-        
+            for k, f in self._futures.items():
+                ref = self._refs[k]
+                if f.exception() and retry_failed:
+                    logger.debug("ParameterResolver: retry '%s' - %s", ref.urn, f.exception())
+                    f = self._executor.submit(wrap(ref.resolve))
+                    futures.append(f)
+                err = f.exception()
+                if err:
+                    raise ArgumentTypeError(f"Cannot resolve '{ref.urn}' for '{k}' - {err}")
+                args[k] = f.result()
+        except BaseException:
+            # don't leak the readables resolved (or still being resolved) so far
+            for f in futures:
+                f.add_done_callback(_close_result)
+            raise
+        finally:
+            if self._executor:
+                self._executor.shutdown(wait=False)
+        return args
+
+def _close_result(f: Future):
+    if not f.cancelled() and not f.exception() and isinstance(f.result(), IOReadable):
+        f.result().close()
+
 def is_valid_resource_urn(urn: str, resource: Resource) -> bool:
     prefix = f"{get_config().SCHEMA_PREFIX}:{resource.value}:"
     return urn.startswith(prefix)
@@ -0,0 +1,195 @@
+#
+# Copyright (c) 2023 Commonwealth Scientific and Industrial Research Organisation (CSIRO). All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file. See the AUTHORS file for names of contributors.
+#
+"""
+Worker mode: process many orders in one long-lived process
+
+An order is a JSON object with the order's 'order_id' and its service arguments as
+'args', either a list of command line arguments or a dict of parameter values. An
+optional 'out_dir' overrides the directory results are placed into (when running
+without storage service). For example:
+
+    {"order_id": "urn:ivcap:order:1", "args": {"image": "urn:ivcap:artifact:2", "size": 10}}
+
+Orders are read as JSON lines from stdin, or as '*.json' files from a directory. Files
+are renamed to '<name>.running' while being processed and afterwards to '<name>.done'
+or '<name>.failed', and the outcome is written to '<name>.result.json'.
+
+Each order runs in its own order context (see 'context.order_context'), so up to
+IVCAP_WORKER_CONCURRENCY orders can be processed concurrently.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import glob
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import ivcap
+from .context import order_context, wrap
+from .logger import sys_logger as logger
+
+# Seconds between checks of the order directory for new orders
+WORKER_POLL = float(os.getenv('IVCAP_WORKER_POLL', 1))
+# Stop after the order directory has been empty for that many seconds. 0 means never.
+WORKER_IDLE_EXIT = float(os.getenv('IVCAP_WORKER_IDLE_EXIT', 0))
+# File to append the outcome of every order to as JSON lines
+WORKER_RESULTS = os.getenv('IVCAP_WORKER_RESULTS')
+# Number of orders processed concurrently
+WORKER_CONCURRENCY = int(os.getenv('IVCAP_WORKER_CONCURRENCY', 1))
+
+OrderF = Callable[[Sequence[str]], int]
+
+def run_worker(source: str, run_order: OrderF, concurrency: Optional[int] = None) -> int:
+    """Process all orders from 'source'.
+
+    Args:
+        source (str): '-' for reading orders from stdin, otherwise a directory
+        run_order (OrderF): Called with the service arguments of an order, while the
+            order's context is active. Returns the exit code of the order.
+        concurrency (int, optional): Number of orders processed concurrently [IVCAP_WORKER_CONCURRENCY=1]
+
+    Returns:
+        int: Number of failed orders
+    """
+    concurrency = concurrency if concurrency else WORKER_CONCURRENCY
+    if source == '-':
+        orders = _stdin_orders()
+    elif os.path.isdir(source):
+        orders = _dir_orders(source)
+    else:
+        raise ValueError(f"Unsupported worker source '{source}' - expected '-' or a directory")
+    if concurrency <= 1:
+        return sum(_finished(process_order(order, run_order), done) for order, done in orders)
+
+    failed = 0
+    with ThreadPoolExecutor(concurrency, thread_name_prefix='order') as ex:
+        pending: Dict[Future, _Done] = {}
+        for order, done in orders:
+            pending[ex.submit(wrap(process_order), order, run_order)] = done
+            # don't claim more orders than we can process
+            while len(pending) >= concurrency:
+                failed += _wait_for_some(pending)
+        while pending:
+            failed += _wait_for_some(pending)
+    return failed
+
+def _wait_for_some(pending: Dict[Future, '_Done']) -> int:
+    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+    return sum(_finished(f.result(), pending.pop(f)) for f in finished)
+
+def _finished(result: Dict[str, Any], done: '_Done') -> int:
+    """Record the outcome of an order and return 1 if it failed"""
+    done(result)
+    if WORKER_RESULTS:
+        with open(WORKER_RESULTS, 'a') as f:
+            f.write(json.dumps(result, default=str) + '\n')
+    return 0 if result['code'] == 0 else 1
+
+def process_order(order: Dict[str, Any], run_order: OrderF) -> Dict[str, Any]:
+    """Run a single order in its own order context and return its outcome"""
+    base = ivcap.get_config()
+    order_id = order.get('order_id')
+    result = dict(order_id=order_id, code=-1, delivered=[])
+    started = time.time()
+    try:
+        with order_context(base.for_order(order_id, order.get('out_dir'))) as ctx:
+            result['delivered'] = ctx.delivered
+            logger.info(f"Starting order '{order_id}'")
+            result['code'] = run_order(to_args(order.get('args', [])))
+    except SystemExit as ex:
+        # argparse exits on illegal arguments. Like the interpreter, treat no code as
+        # success and any other non-integer (e.g. a message) as failure.
+        if ex.code == None:
+            result['code'] = 0
+        else:
+            result['code'] = ex.code if isinstance(ex.code, int) else 1
+        if result['code'] != 0:
+            result['error'] = f"exit({ex.code})"
+    except Exception as err:
+        logger.exception(err)
+        result['error'] = str(err)
+    result['duration'] = time.time() - started
+    logger.info(f"Finished order '{order_id}' with code {result['code']} after {result['duration']:.2f}sec")
+    return result
+
+def to_args(args: Any) -> List[str]:
+    """Return the command line arguments for the 'args' of an order"""
+    if isinstance(args, dict):
+        argv = []
+        for k, v in args.items():
+            if v is True:
+                argv.append(f"--{k}")
+            elif v is not False and v != None:
+                argv += [f"--{k}", str(v)]
+        return argv
+    return [str(a) for a in args]
+
+_Done = Callable[[Dict[str, Any]], None]
+
+def _stdin_orders() -> Iterator[Tuple[Dict[str, Any], _Done]]:
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            order = _check_order(json.loads(line))
+        except ValueError as err:
+            logger.error(f"Ignoring malformed order '{line}' - {err}")
+            continue
+        yield (order, lambda _: None)
+
+def _dir_orders(dir: str) -> Iterator[Tuple[Dict[str, Any], _Done]]:
+    idle_since = time.time()
+    while True:
+        order_files = sorted(glob.glob(os.path.join(dir, '*.json')), key=_mtime)
+        order_files = [f for f in order_files if not f.endswith('.result.json')]
+        for path in order_files:
+            running = f"{path[:-len('.json')]}.running"
+            try:
+                # claim it, other workers may be watching the same directory
+                os.rename(path, running)
+            except OSError:
+                continue
+            try:
+                with open(running) as f:
+                    order = _check_order(json.load(f), os.path.basename(path)[:-len('.json')])
+            except ValueError as err:
+                logger.error(f"Ignoring malformed order '{path}' - {err}")
+                os.rename(running, f"{path[:-len('.json')]}.failed")
+                continue
+            yield (order, _mark_done(path, running))
+        if order_files:
+            idle_since = time.time()
+        elif WORKER_IDLE_EXIT and time.time() - idle_since > WORKER_IDLE_EXIT:
+            logger.info(f"No new orders in '{dir}' for {WORKER_IDLE_EXIT}sec - exiting")
+            return
+        else:
+            time.sleep(WORKER_POLL)
+
+def _check_order(order: Any, default_id: Optional[str] = None) -> Dict[str, Any]:
+    """Return 'order' if it is a valid order, using 'default_id' if it has no 'order_id'"""
+    if not isinstance(order, dict):
+        raise ValueError('expected a JSON object')
+    if default_id:
+        order.setdefault('order_id', default_id)
+    if not order.get('order_id'):
+        raise ValueError("missing 'order_id'")
+    return order
+
+def _mark_done(path: str, running: str) -> _Done:
+    base = path[:-len('.json')]
+    def done(result: Dict[str, Any]):
+        with open(f"{base}.result.json", 'w') as f:
+            json.dump(result, f, default=str)
+        os.rename(running, f"{base}.done" if result['code'] == 0 else f"{base}.failed")
+    return done
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
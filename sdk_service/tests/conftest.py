@@ -0,0 +1,150 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+class _ContentHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        if self.path in self.server.uploads:
+            upload = self.server.uploads[self.path]
+            self.server.requests.append((self.command, self.path, dict(self.headers)))
+            self.send_response(200)
+            self.send_header('Tus-Resumable', '1.0.0')
+            self.send_header('Upload-Offset', str(len(upload['data'])))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._reply(False)
+
+    def do_GET(self):
+        self._reply(True)
+
+    def do_OPTIONS(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        self.send_response(204 if self.server.tus else 405)
+        if self.server.tus:
+            self.send_header('Tus-Resumable', '1.0.0')
+            self.send_header('Tus-Version', '1.0.0')
+            self.send_header('Tus-Extension', self.server.tus_extensions)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = bytearray()
+            while True:
+                line = self.rfile.readline().strip()
+                if not line:
+                    return # the client broke off the upload
+                size = int(line, 16)
+                chunk = self.rfile.read(size + 2)[:size]
+                if size == 0:
+                    break
+                body += chunk
+            body = bytes(body)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        if self.server.tus and self.headers.get('Tus-Resumable'):
+            return self._create_upload()
+        self.server.posted.append((dict(self.headers), body))
+        id = f"urn:ivcap:artifact:{len(self.server.posted)}"
+        reply = json.dumps({'id': id, 'size': len(body)}).encode()
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.send_header('Location', f"{self.server.url}/1/artifacts/{id}")
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def do_PATCH(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        upload = self.server.uploads[self.path]
+        status = 204
+        if int(self.headers['Upload-Offset']) != len(upload['data']):
+            status = 409
+        elif self.server.fail_patches > 0:
+            # simulate a connection dropping half way through the chunk
+            self.server.fail_patches -= 1
+            upload['data'] += body[:len(body) // 2]
+            status = 500
+        else:
+            upload['data'] += body
+        self.send_response(status)
+        self.send_header('Tus-Resumable', '1.0.0')
+        self.send_header('Upload-Offset', str(len(upload['data'])))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _create_upload(self):
+        concat = self.headers.get('Upload-Concat', '')
+        path = f"/uploads/{len(self.server.uploads) + 1}"
+        upload = {'headers': dict(self.headers), 'data': bytearray()}
+        self.server.uploads[path] = upload
+        if concat.startswith('final;'):
+            for url in concat[len('final;'):].split(' '):
+                upload['data'] += self.server.uploads[url[len(self.server.url):]]['data']
+        reply = b'{}'
+        if concat != 'partial':
+            self.server.posted.append((upload['headers'], upload['data']))
+            id = f"urn:ivcap:artifact:{len(self.server.posted)}"
+            reply = json.dumps({'id': id}).encode()
+        self.send_response(201)
+        self.send_header('Tus-Resumable', '1.0.0')
+        self.send_header('Location', path)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def _reply(self, with_body):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        content = self.server.content.get(self.path)
+        if content is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if with_body:
+            self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def content_server():
+    """Serve the 'content' dict (path -> bytes) over HTTP. All requests
+    received are recorded in 'requests', and the headers and body of
+    POST requests in 'posted'. If 'tus' is set, POST requests with a
+    'Tus-Resumable' header create resumable uploads in 'uploads'
+    and the next 'fail_patches' PATCH requests only store half their body.
+    OPTIONS requests list 'tus_extensions' as supported."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ContentHandler)
+    server.content = {}
+    server.requests = []
+    server.posted = []
+    server.tus = False
+    server.tus_extensions = 'creation,concatenation'
+    server.uploads = {}
+    server.fail_patches = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
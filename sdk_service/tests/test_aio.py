@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from ivcap_sdk_service import ivcap, afetch_data, adeliver_data
+from ivcap_sdk_service.cio.local_io_adapter import LocalIOAdapter
+from ivcap_sdk_service.delivery import drain_deliveries
+from ivcap_sdk_service.run import complete_deliveries
+
+def _config(tmp_path, monkeypatch):
+    in_dir, out_dir = tmp_path / 'in', tmp_path / 'out'
+    in_dir.mkdir()
+    out_dir.mkdir()
+    adapter = LocalIOAdapter(str(in_dir), str(out_dir))
+    monkeypatch.setattr(ivcap, '_CONFIG', SimpleNamespace(IO_ADAPTER=adapter, SCHEMA_PREFIX='urn:ivcap:'))
+    monkeypatch.setattr(ivcap, 'DELIVERED', [])
+    return in_dir, out_dir
+
+def test_fetch_concurrently(tmp_path, monkeypatch):
+    in_dir, _ = _config(tmp_path, monkeypatch)
+    for i in range(20):
+        (in_dir / f"f{i}").write_bytes(b'x' * i)
+    async def fetch(i):
+        async with await afetch_data(str(in_dir / f"f{i}")) as r:
+            return b''.join([c async for c in r])
+    async def main():
+        return await asyncio.gather(*[fetch(i) for i in range(20)])
+    assert asyncio.run(main()) == [b'x' * i for i in range(20)]
+
+def test_deliver(tmp_path, monkeypatch):
+    _, out_dir = _config(tmp_path, monkeypatch)
+    async def write(w):
+        await w.write(b'async')
+    async def main():
+        await asyncio.gather(
+            adeliver_data('a.out', write, 'application/octet-stream'),
+            adeliver_data('b.out', lambda fd: fd.write(b'sync'), 'application/octet-stream'),
+        )
+    asyncio.run(main())
+    assert (out_dir / 'a.out').read_bytes() == b'async'
+    assert (out_dir / 'b.out').read_bytes() == b'sync'
+    assert sorted(d['name'] for d in ivcap.DELIVERED) == ['a.out', 'b.out']
+
+def test_failed_async_delivery(tmp_path, monkeypatch):
+    _, out_dir = _config(tmp_path, monkeypatch)
+    async def write(w):
+        await w.write(b'partial')
+        raise ValueError('no more data')
+    async def main():
+        await adeliver_data('a.out', write, 'application/octet-stream')
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+    assert not (out_dir / 'a.out').exists()
+    assert ivcap.DELIVERED == []
+    # the error was raised to the handler, which decides whether the order fails
+    assert drain_deliveries() == []
+
+def test_handled_async_delivery_error(tmp_path, monkeypatch):
+    _, out_dir = _config(tmp_path, monkeypatch)
+    async def write(w):
+        raise ValueError('no data')
+    async def main():
+        try:
+            await adeliver_data('a.out', write, 'application/octet-stream')
+        except ValueError:
+            await adeliver_data('a.out', lambda fd: fd.write(b'fallback'), 'application/octet-stream')
+    asyncio.run(main())
+    assert complete_deliveries() # the order succeeds
+    assert (out_dir / 'a.out').read_bytes() == b'fallback'
+    assert [d['name'] for d in ivcap.DELIVERED] == ['a.out']
@@ -0,0 +1,195 @@
+from argparse import ArgumentTypeError
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from ivcap_sdk_service.cio.cache import STALE_PART_AGE, Cache, get_cache_name
+from ivcap_sdk_service.config import Command, Config
+
+def _entries(path):
+    return set(n for n in os.listdir(path) if not n.startswith('.'))
+
+def _gets(server):
+    return [r for r in server.requests if r[0] == 'GET']
+
+def _fill(cache, url):
+    r = cache.get_and_cache_file(url)
+    data = r.read()
+    r.close()
+    return data
+
+def test_cache_hit(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 100
+    cache = Cache(str(tmp_path))
+    url = f"{content_server.url}/a"
+    assert _fill(cache, url) == b'a' * 100
+    assert _fill(cache, url) == b'a' * 100
+    assert len(_gets(content_server)) == 1
+    assert cache.size == 100
+
+def test_lru_eviction(tmp_path, content_server):
+    for n in 'abc':
+        content_server.content[f"/{n}"] = n.encode() * 400
+    cache = Cache(str(tmp_path), max_bytes=1000)
+    url = lambda n: f"{content_server.url}/{n}"
+    _fill(cache, url('a'))
+    _fill(cache, url('b'))
+    _fill(cache, url('a'))  # 'b' is now least recently used
+    _fill(cache, url('c'))
+    cached = _entries(tmp_path)
+    assert cached == {get_cache_name(url('a')), get_cache_name(url('c'))}
+    assert cache.size == 800
+
+def test_picks_up_existing_entries(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 600
+    url = f"{content_server.url}/a"
+    _fill(Cache(str(tmp_path)), url)
+    content_server.content['/b'] = b'b' * 600
+    cache = Cache(str(tmp_path), max_bytes=1000)
+    assert cache.size == 600
+    _fill(cache, f"{content_server.url}/b")
+    assert _entries(tmp_path) == {get_cache_name(f"{content_server.url}/b")}
+
+def test_revalidation(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 100
+    url = f"{content_server.url}/a"
+    cache = Cache(str(tmp_path), revalidate_ttl=0)
+    assert _fill(cache, url) == b'a' * 100
+    assert _fill(cache, url) == b'a' * 100
+    assert _gets(content_server)[-1][2].get('If-None-Match')
+    content_server.content['/a'] = b'b' * 50
+    assert _fill(cache, url) == b'b' * 50
+    assert len(_gets(content_server)) == 3
+    assert cache.size == 50
+
+def test_single_flight(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 100000
+    url = f"{content_server.url}/a"
+    cache = Cache(str(tmp_path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(_fill(cache, url))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [b'a' * 100000] * 8
+    assert len(_gets(content_server)) == 1
+    assert not [n for n in os.listdir(tmp_path) if n.endswith('.part')]
+    assert cache._fill_locks == {}
+
+def test_immutable_artifact(tmp_path, content_server):
+    content_server.content['/1/artifacts/urn:ivcap:artifact:123'] = b'x' * 10
+    url = f"{content_server.url}/1/artifacts/urn:ivcap:artifact:123"
+    cache = Cache(str(tmp_path), revalidate_ttl=0)
+    for _ in range(3):
+        r = cache.get_and_cache_file(url, key='urn:ivcap:artifact:123', immutable=True)
+        assert r.read() == b'x' * 10
+        r.close()
+    assert len(_gets(content_server)) == 1
+    assert _entries(tmp_path) == {get_cache_name('urn:ivcap:artifact:123')}
+
+def test_hit_as_memoryview(tmp_path, content_server):
+    content_server.content['/a'] = bytes(range(256)) * 16
+    cache = Cache(str(tmp_path))
+    url = f"{content_server.url}/a"
+    _fill(cache, url)
+    r = cache.get_and_cache_file(url)
+    view = r.as_memoryview()
+    assert view.readonly
+    assert view[256:260] == bytes([0, 1, 2, 3])
+    r.close() # view is still in use
+    assert bytes(view) == content_server.content['/a']
+    view.release()
+
+def test_catalog(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 100
+    url = f"{content_server.url}/a"
+    cache = Cache(str(tmp_path))
+    _fill(cache, url)
+    _fill(cache, url)
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['hits'], stats['misses']) == (1, 100, 1, 1)
+    # another process picks up the entry from the catalog without fetching it again
+    script = f"""
+import json
+from ivcap_sdk_service.cio.cache import Cache
+cache = Cache({str(tmp_path)!r})
+r = cache.get_and_cache_file({url!r})
+assert r.read() == b'a' * 100
+r.close()
+print(json.dumps(cache.stats()))
+"""
+    out = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+    stats = json.loads(out.strip().splitlines()[-1])
+    assert (stats['entries'], stats['bytes'], stats['hits'], stats['misses']) == (1, 100, 1, 0)
+    assert len(_gets(content_server)) == 1
+
+def test_entry_removed_behind_our_back(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 100
+    url = f"{content_server.url}/a"
+    cache = Cache(str(tmp_path))
+    _fill(cache, url)
+    os.remove(tmp_path / get_cache_name(url))
+    assert _fill(cache, url) == b'a' * 100
+    assert len(_gets(content_server)) == 2
+
+def test_max_bytes_from_env(tmp_path, monkeypatch):
+    argv = ['--ivcap:in-dir', str(tmp_path), '--ivcap:out-dir', str(tmp_path), '--ivcap:cache-dir', str(tmp_path)]
+    monkeypatch.setenv('IVCAP_CACHE_MAX_BYTES', 'lots')
+    c = Config(['-H'] + argv) # only a problem once the cache is used
+    assert c.SERVICE_COMMAND == Command.SERVICE_HELP
+    with pytest.raises(ArgumentTypeError):
+        c.CACHE
+    monkeypatch.setenv('IVCAP_CACHE_MAX_BYTES', '1K')
+    assert Config(argv).CACHE.stats()['max_bytes'] == 1024
+
+def test_miss_follows_fill(tmp_path, content_server):
+    content = bytes(range(256)) * 1000 + b'\nlast line'
+    content_server.content['/a'] = content
+    url = f"{content_server.url}/a"
+    cache = Cache(str(tmp_path))
+    r = cache.get_and_cache_file(url)
+    assert r.read(10) == content[:10]
+    assert r.readline() == content[10:content.index(b'\n', 10) + 1]
+    r.seek(0)
+    assert r.read() == content
+    assert r.as_local_file() == str(tmp_path / get_cache_name(url))
+    r.close()
+    assert _fill(cache, url) == content
+    assert len(_gets(content_server)) == 1
+    assert cache.stats()['entries'] == 1
+
+def test_seekable_miss(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 100
+    url = f"{content_server.url}/a"
+    cache = Cache(str(tmp_path))
+    r = cache.get_and_cache_file(url, seekable=True)
+    assert r.seek(0, os.SEEK_END) == 100 and r.tell() == 100
+    r.close()
+    assert _entries(tmp_path) == {get_cache_name(url)}
+
+def test_eviction_keeps_lock_files(tmp_path, content_server):
+    for n in 'ab':
+        content_server.content[f"/{n}"] = n.encode() * 600
+    cache = Cache(str(tmp_path), max_bytes=1000)
+    _fill(cache, f"{content_server.url}/a")
+    _fill(cache, f"{content_server.url}/b")
+    assert f".{get_cache_name(f'{content_server.url}/a')}.lock" in os.listdir(tmp_path)
+
+def test_stale_parts_removed_on_reopen(tmp_path, content_server):
+    content_server.content['/a'] = b'a' * 100
+    url = f"{content_server.url}/a"
+    _fill(Cache(str(tmp_path)), url)
+    # left behind by processes which exited during a fill
+    stale, recent = tmp_path / '.x.1.part', tmp_path / '.x.2.part'
+    stale.write_bytes(b'x')
+    recent.write_bytes(b'x')
+    old = time.time() - STALE_PART_AGE - 10
+    os.utime(stale, (old, old))
+    Cache(str(tmp_path))
+    assert not stale.exists() and recent.exists()
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+from ivcap_sdk_service import ivcap
+from ivcap_sdk_service.config import Config
+from ivcap_sdk_service.context import order_context
+from ivcap_sdk_service.delivery import DeliveryExecutor, drain_deliveries
+
+def _config(tmp_path, monkeypatch):
+    c = Config(['--ivcap:in-dir', str(tmp_path), '--ivcap:out-dir', str(tmp_path), '--ivcap:cache-dir', ''])
+    monkeypatch.setattr(ivcap, '_CONFIG', c)
+    monkeypatch.setattr(ivcap, 'DELIVERED', [])
+    return c
+
+def test_concurrent_orders_in_threads(tmp_path, monkeypatch):
+    base = _config(tmp_path, monkeypatch)
+    barrier = threading.Barrier(4)
+    seen = {}
+    def order(i):
+        with order_context(base.for_order(f"o{i}")) as ctx:
+            barrier.wait()
+            ivcap.deliver_data(f"r{i}", lambda fd: fd.write(ivcap.get_order_id()), 'text/plain')
+            assert drain_deliveries() == []
+            seen[i] = (ivcap.get_order_id(), [d['name'] for d in ctx.delivered])
+    threads = [threading.Thread(target=order, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert seen == {i: (f"o{i}", [f"r{i}"]) for i in range(4)}
+    assert (tmp_path / 'r2').read_text() == 'o2'
+    assert ivcap.get_order_id() == None and ivcap.DELIVERED == []
+
+def test_asyncio_tasks(tmp_path, monkeypatch):
+    base = _config(tmp_path, monkeypatch)
+    async def order(i):
+        with order_context(base.for_order(f"o{i}")):
+            await asyncio.sleep(0.01 * (3 - i))
+            return ivcap.get_order_id()
+    async def main():
+        return await asyncio.gather(*[order(i) for i in range(3)])
+    assert asyncio.run(main()) == ['o0', 'o1', 'o2']
+
+def test_drain_only_waits_for_own_deliveries(tmp_path, monkeypatch):
+    base = _config(tmp_path, monkeypatch)
+    ex = DeliveryExecutor(workers=2)
+    release = threading.Event()
+    with order_context(base.for_order('slow')):
+        slow = ex.submit(release.wait, 'slow')
+    with order_context(base.for_order('fast')):
+        def fail():
+            raise Exception(ivcap.get_order_id())
+        ex.submit(fail, 'fast')
+        assert [str(e) for e in ex.drain()] == ['fast']
+    assert not slow.done()
+    release.set()
+    assert ex.drain() == []
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+
+from ivcap_sdk_service.delivery import DeliveryExecutor
+
+def test_bounded_in_flight():
+    ex = DeliveryExecutor(workers=2, max_pending=3)
+    lock = threading.Lock()
+    running = [0, 0] # current, max
+    def deliver():
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+    futures = [ex.submit(deliver, f"r{i}") for i in range(10)]
+    assert ex.drain() == []
+    assert all(f.done() for f in futures)
+    assert running[1] == 2
+
+def test_drain_reports_errors():
+    ex = DeliveryExecutor(workers=2)
+    def fail():
+        raise Exception('upload failed')
+    f = ex.submit(fail, 'bad')
+    ex.submit(lambda: None, 'good')
+    errors = ex.drain()
+    assert [str(e) for e in errors] == ['upload failed']
+    assert f.exception() is errors[0]
+    assert ex.drain() == []
+
+def test_synchronous():
+    ex = DeliveryExecutor(workers=0)
+    done = []
+    f = ex.submit(lambda: done.append(threading.current_thread()), 'r')
+    assert f.done() and done == [threading.current_thread()]
+    with pytest.raises(ZeroDivisionError):
+        ex.submit(lambda: 1 / 0, 'r')
+
+def test_drain_reports_late_errors():
+    # fails after 'drain' has taken it off the pending list
+    ex = DeliveryExecutor(workers=1)
+    started = threading.Event()
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise Exception('upload failed')
+    ex.submit(fail, 'bad')
+    started.wait()
+    assert [str(e) for e in ex.drain()] == ['upload failed']
@@ -0,0 +1,77 @@
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ivcap_sdk_service.cio.utils import download, http_session
+
+CONTENT = bytes(range(256)) * 1000
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    accept_ranges = True
+    ranges = []
+    ports = set()
+
+    def do_HEAD(self):
+        self._send_headers(200, len(CONTENT))
+
+    def do_GET(self):
+        _Handler.ports.add(self.client_address[1])
+        m = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if m and self.accept_ranges:
+            lo, hi = int(m[1]), int(m[2])
+            _Handler.ranges.append((lo, hi))
+            body = CONTENT[lo:hi + 1]
+            self._send_headers(206, len(body))
+        else:
+            body = CONTENT
+            self._send_headers(200, len(body))
+        self.wfile.write(body)
+
+    def _send_headers(self, status, length):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        if self.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def url():
+    _Handler.ranges = []
+    _Handler.ports = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/data.bin"
+    server.shutdown()
+    server.server_close()
+
+def test_parallel_ranges(url):
+    with tempfile.TemporaryFile('w+b') as f:
+        download(url, f, close_fhdl=False, part_size=10000, workers=4)
+        assert f.tell() == len(CONTENT)
+        f.seek(0)
+        assert f.read() == CONTENT
+    assert len(_Handler.ranges) == 26
+    assert sorted(_Handler.ranges)[-1] == (250000, len(CONTENT) - 1)
+
+def test_no_range_support(url, monkeypatch):
+    monkeypatch.setattr(_Handler, 'accept_ranges', False)
+    with tempfile.TemporaryFile('w+b') as f:
+        download(url, f, close_fhdl=False, part_size=10000, workers=4)
+        f.seek(0)
+        assert f.read() == CONTENT
+    assert _Handler.ranges == []
+
+def test_connections_are_reused(url):
+    for _ in range(5):
+        with tempfile.TemporaryFile('w+b') as f:
+            download(url, f, close_fhdl=False, workers=1)
+    assert len(_Handler.ports) == 1
+    assert http_session() is http_session()
@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+# Modules which are slow to import and only needed once data is transferred
+DEFERRED = ['requests', 'urllib3', 'yaml', 'validators', 'asyncio', 'sqlite3', 'ivcap_sdk_service.cio.utils']
+
+def _loaded(code):
+    out = subprocess.run([sys.executable, '-c', f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+                         capture_output=True, text=True, check=True).stdout
+    return set(out.split())
+
+def test_import_defers_heavy_modules():
+    loaded = _loaded('from ivcap_sdk_service import Service, Parameter, Type, register_service')
+    assert [m for m in DEFERRED if m in loaded] == []
+
+def test_lazy_names():
+    loaded = _loaded('from ivcap_sdk_service import deliver_data, IOReadable, __version__\nfrom ivcap_sdk_service.cio import Cache')
+    assert 'ivcap_sdk_service.cio.cache' in loaded
+    assert 'ivcap_sdk_service.aio' not in loaded
@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ivcap_sdk_service import ivcap, map_collection
+from ivcap_sdk_service.cio.local_io_adapter import LocalIOAdapter
+from ivcap_sdk_service.cio.prefetch import PrefetchIter
+
+def _slow_square(i):
+    time.sleep(0.01 * (5 - i % 5))
+    return i * i
+
+def test_threads_ordered():
+    assert list(map_collection(_slow_square, range(20), workers=4, executor='thread')) == [i * i for i in range(20)]
+
+def test_threads_unordered_with_backpressure():
+    submitted = []
+    def items():
+        for i in range(20):
+            submitted.append(i)
+            yield i
+    results = []
+    for r in map_collection(_slow_square, items(), workers=2, executor='thread', ordered=False, max_pending=3):
+        assert len(submitted) - len(results) <= 3
+        results.append(r)
+    assert sorted(results) == [i * i for i in range(20)]
+
+def _deliver_upper(r):
+    data = r.read().upper()
+    ivcap.deliver_data(f"{os.path.basename(r.name)}.out", lambda fd: fd.write(data), 'application/octet-stream')
+    return os.getpid()
+
+def test_processes_deliver(tmp_path, monkeypatch):
+    in_dir, out_dir = tmp_path / 'in', tmp_path / 'out'
+    in_dir.mkdir()
+    out_dir.mkdir()
+    for n in 'abcd':
+        (in_dir / n).write_bytes(n.encode() * 10)
+    adapter = LocalIOAdapter(str(in_dir), str(out_dir))
+    monkeypatch.setattr(ivcap, '_CONFIG', SimpleNamespace(IO_ADAPTER=adapter, SCHEMA_PREFIX='urn:ivcap:'))
+    monkeypatch.setattr(ivcap, 'DELIVERED', [])
+    pids = list(map_collection(_deliver_upper, adapter.get_collection(str(in_dir)), workers=2, executor='process'))
+    assert os.getpid() not in pids
+    assert sorted(d['name'] for d in ivcap.DELIVERED) == ['a.out', 'b.out', 'c.out', 'd.out']
+    assert (out_dir / 'c.out').read_bytes() == b'C' * 10
+
+def test_error_stops_iteration():
+    def fail(i):
+        if i == 3:
+            raise ValueError(i)
+        return i
+    with pytest.raises(ValueError):
+        list(map_collection(fail, range(10), workers=2, executor='thread'))
+
+def test_stopping_early_closes_prefetched():
+    opened = []
+    class Item:
+        closed = False
+        def prefetch(self):
+            pass
+        def close(self):
+            self.closed = True
+    def open(i):
+        opened.append(Item())
+        return opened[-1]
+    items = PrefetchIter(range(20), open, window=4)
+    results = map_collection(lambda _: None, items, workers=1, executor='thread')
+    next(results)
+    results.close()
+    items._executor.shutdown(wait=True)
+    assert len(opened) < 20
+    assert all(r.closed for r in opened[2:])
@@ -0,0 +1,67 @@
+from argparse import ArgumentParser, ArgumentTypeError
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ivcap_sdk_service import ivcap
+from ivcap_sdk_service.cio.local_io_adapter import LocalIOAdapter
+from ivcap_sdk_service.run import run_service
+from ivcap_sdk_service.verifiers import ArtifactAction, ArtifactRef, CollectionAction, CollectionRef, ParameterResolver
+
+def _parse(tmp_path, monkeypatch, names):
+    for n in names:
+        (tmp_path / n).write_bytes(n.encode() * 10)
+    adapter = LocalIOAdapter(str(tmp_path), str(tmp_path))
+    monkeypatch.setattr(ivcap, '_CONFIG', SimpleNamespace(IO_ADAPTER=adapter, SCHEMA_PREFIX='urn:ivcap'))
+    ap = ArgumentParser()
+    argv = []
+    for n in names:
+        ap.add_argument(f"--{n}", action=ArtifactAction)
+        argv += [f"--{n}", str(tmp_path / n)]
+    ap.add_argument('--coll', action=CollectionAction)
+    ap.add_argument('--count', type=int)
+    return vars(ap.parse_args(argv + ['--coll', str(tmp_path), '--count', '3']))
+
+def test_parsed_into_references(tmp_path, monkeypatch):
+    args = _parse(tmp_path, monkeypatch, ['a', 'b'])
+    assert isinstance(args['a'], ArtifactRef) and isinstance(args['coll'], CollectionRef)
+    args = ParameterResolver(args).result()
+    assert args['a'].read() == b'a' * 10
+    assert args['b'].read() == b'b' * 10
+    assert sorted(r.name for r in args['coll']) == sorted(str(tmp_path / n) for n in 'ab')
+    assert args['count'] == 3
+
+def test_resolved_concurrently(tmp_path, monkeypatch):
+    names = [f"f{i}" for i in range(6)]
+    args = _parse(tmp_path, monkeypatch, names)
+    threads = set()
+    def resolve(self):
+        threads.add(threading.current_thread())
+        time.sleep(0.05)
+        return self.urn
+    monkeypatch.setattr(ArtifactRef, 'resolve', resolve)
+    started = time.time()
+    args = ParameterResolver(args, workers=6).result()
+    assert time.time() - started < 0.2
+    assert len(threads) > 1
+    assert args['f3'] == str(tmp_path / 'f3')
+
+def test_retry_failed(tmp_path, monkeypatch):
+    args = _parse(tmp_path, monkeypatch, ['a'])
+    (tmp_path / 'a').unlink()
+    resolver = ParameterResolver(args)
+    with pytest.raises(ArgumentTypeError):
+        ParameterResolver(args).result()
+    resolver._futures['a'].exception() # wait for the first attempt
+    (tmp_path / 'a').write_bytes(b'late')
+    assert resolver.result(retry_failed=True)['a'].read() == b'late'
+
+def test_unresolvable_argument(tmp_path, monkeypatch, capsys):
+    _parse(tmp_path, monkeypatch, [])
+    service = SimpleNamespace(description='test', append_arguments=lambda ap: ap.add_argument('--img', action=ArtifactAction))
+    with pytest.raises(SystemExit) as ex:
+        run_service(service, ['--img', str(tmp_path / 'missing')], lambda args: 0)
+    assert ex.value.code == 2
+    assert 'missing' in capsys.readouterr().err
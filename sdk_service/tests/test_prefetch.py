@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from ivcap_sdk_service.cio.local_io_adapter import LocalIOAdapter
+from ivcap_sdk_service.cio.prefetch import PrefetchIter
+
+class _Readable:
+    def __init__(self, item, opened):
+        self.item = item
+        self.prefetched = False
+        self.closed = False
+        opened.append(self)
+
+    def prefetch(self):
+        self.prefetched = True
+
+    def close(self):
+        self.closed = True
+
+def test_in_order_within_window():
+    opened = []
+    lock = threading.Lock()
+    returned = [0]
+    ahead = []
+    def open(i):
+        with lock:
+            ahead.append(len(opened) - returned[0])
+            return _Readable(i, opened)
+    it = PrefetchIter(range(20), open, window=3, workers=2)
+    for n, r in enumerate(it):
+        assert r.item == n and r.prefetched
+        with lock:
+            returned[0] += 1
+    assert max(ahead) <= 3
+
+def test_open_error_raised_in_order():
+    def open(i):
+        if i == 2:
+            raise ValueError(i)
+        return _Readable(i, [])
+    it = PrefetchIter(range(5), open, window=2)
+    assert [next(it).item, next(it).item] == [0, 1]
+    with pytest.raises(ValueError):
+        next(it)
+
+def test_close_releases_prefetched():
+    opened = []
+    it = PrefetchIter(range(10), lambda i: _Readable(i, opened), window=4)
+    next(it)
+    it.close()
+    it._executor.shutdown(wait=True)
+    assert all(r.closed for r in opened[1:])
+    with pytest.raises(StopIteration):
+        next(it)
+
+def test_local_collection(tmp_path):
+    for n in 'abc':
+        (tmp_path / n).write_bytes(n.encode() * 10)
+    adapter = LocalIOAdapter(str(tmp_path), str(tmp_path))
+    contents = []
+    for r in adapter.get_collection(str(tmp_path)):
+        contents.append(r.read())
+        r.close()
+    assert contents == [b'a' * 10, b'b' * 10, b'c' * 10]
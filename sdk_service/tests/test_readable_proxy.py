@@ -0,0 +1,123 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ivcap_sdk_service.cio import readable_proxy
+from ivcap_sdk_service.cio.readable_proxy import ReadableProxy
+
+CONTENT = bytes(range(256)) * 4096  # 1MB
+
+class _Handler(BaseHTTPRequestHandler):
+    gets = 0
+
+    def do_GET(self):
+        _Handler.gets += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONTENT)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def url():
+    _Handler.gets = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/data.bin"
+    server.shutdown()
+    server.server_close()
+
+def test_streaming_read(url):
+    r = ReadableProxy(url, stream=True)
+    assert r.read(10) == CONTENT[:10]
+    assert r.tell() == 10
+    assert r._file_obj is None
+    assert r.read() == CONTENT[10:]
+    r.close()
+
+def test_streaming_rewind_without_download(url):
+    r = ReadableProxy(url, stream=True)
+    head = r.read(16)
+    r.seek(0)
+    assert r.read(16) == head
+    r.seek(1000, io.SEEK_CUR)
+    assert r.read(4) == CONTENT[1016:1020]
+    assert r._file_obj is None
+    r.close()
+    assert _Handler.gets == 1
+
+def test_streaming_spools_on_demand(url, monkeypatch):
+    monkeypatch.setattr(readable_proxy, 'REWIND_LIMIT', 1024)
+    r = ReadableProxy(url, stream=True)
+    assert r.read(100) == CONTENT[:100]
+    assert r.seek(-10, io.SEEK_END) == len(CONTENT) - 10
+    assert r.read() == CONTENT[-10:]
+    r.seek(0)
+    assert r.read(5000) == CONTENT[:5000]
+    with open(r.as_local_file(), 'rb') as f:
+        assert f.read() == CONTENT
+    r.close()
+    assert _Handler.gets == 1
+
+def test_streaming_as_memoryview(url):
+    r = ReadableProxy(url, stream=True)
+    assert r.read(10) == CONTENT[:10]
+    view = r.as_memoryview()
+    assert len(view) == len(CONTENT) and view[-3:] == CONTENT[-3:]
+    assert r.read(5) == CONTENT[10:15]
+    view.release()
+    r.close()
+    assert _Handler.gets == 1
+
+def test_streaming_readinto(url, monkeypatch):
+    monkeypatch.setattr(readable_proxy, 'REWIND_LIMIT', 1024)
+    cache = io.BytesIO()
+    r = ReadableProxy(url, stream=True, cache=cache)
+    buf = bytearray(3000)
+    assert r.readinto(buf) == 3000 # served from the rewind buffer
+    assert buf == CONTENT[:3000]
+    n = r.readinto(memoryview(buf)[:1000]) # past the rewind limit, straight from the socket
+    assert n == 1000 and buf[:1000] == CONTENT[3000:4000]
+    while r.readinto1(buf) > 0:
+        pass
+    assert r.tell() == len(CONTENT)
+    assert r._file_obj is None
+    assert cache.getvalue() == CONTENT
+    r.close()
+
+def test_streaming_seek_forward_caches_skipped_bytes(url, monkeypatch):
+    monkeypatch.setattr(readable_proxy, 'REWIND_LIMIT', 1024)
+    cache = io.BytesIO()
+    r = ReadableProxy(url, stream=True, cache=cache)
+    assert r.read(10) == CONTENT[:10]
+    r.seek(100) # inside the fetched buffer
+    r.seek(5000, io.SEEK_CUR) # beyond it
+    assert r.read(10) == CONTENT[5100:5110]
+    assert r.seek(len(CONTENT)) == len(CONTENT)
+    assert r._file_obj is None
+    assert cache.getvalue() == CONTENT
+    r.close()
+
+def test_streaming_lines(url, monkeypatch):
+    monkeypatch.setattr(readable_proxy, 'REWIND_LIMIT', 1024)
+    r = ReadableProxy(url, stream=True)
+    assert r.readline() == CONTENT[:11]
+    assert r.readline(5) == CONTENT[11:16]
+    lines = list(r)
+    assert len(lines) == 4096 # the last one has no trailing newline
+    assert all(len(l) == 256 for l in lines[1:-1])
+    assert CONTENT[:16] + b''.join(lines) == CONTENT
+    assert r._file_obj is None
+    r.close()
+
+def test_iter_chunks(url):
+    r = ReadableProxy(url, stream=True)
+    sizes = [len(c) for c in r.iter_chunks(300000)]
+    assert sizes == [300000, 300000, 300000, len(CONTENT) - 900000]
+    r.close()
@@ -0,0 +1,75 @@
+import json
+from urllib.parse import urlencode
+
+from ivcap_sdk_service.cio.ivcap_io_adapter import IvcapIOAdapter
+from ivcap_sdk_service.cio.local_io_adapter import LocalIOAdapter
+
+URN = 'urn:ivcap:collection:c1'
+
+def _adapter(server, tmp_path):
+    return IvcapIOAdapter(server.url, str(tmp_path), str(tmp_path), 'o1', lambda id: f"{server.url}/data/{id}")
+
+def _listing(server, n, per_page):
+    ids = [f"urn:ivcap:artifact:{i}" for i in range(n)]
+    for id in ids:
+        server.content[f"/data/{id}"] = id.encode()
+    first = '/1/artifacts?' + urlencode({'filter': f"collection eq '{URN}'", 'limit': 100})
+    pages = [ids[i:i + per_page] for i in range(0, n, per_page)]
+    for i, page in enumerate(pages):
+        path = first if i == 0 else f"/1/artifacts/page{i}"
+        links = {'next': f"/1/artifacts/page{i + 1}"} if i + 1 < len(pages) else {}
+        server.content[path] = json.dumps({'artifacts': [{'id': id} for id in page], 'links': links}).encode()
+    return ids
+
+def _read_all(collection):
+    contents = []
+    for r in collection:
+        contents.append(r.read().decode())
+        r.close()
+    return contents
+
+def test_paged_collection(content_server, tmp_path):
+    ids = _listing(content_server, 7, 3)
+    collection = _adapter(content_server, tmp_path).get_collection(URN)
+    assert collection.name == URN
+    assert content_server.requests == [] # nothing is listed before iterating
+    assert _read_all(collection) == ids
+    listed = [r[1] for r in content_server.requests if r[1].startswith('/1/artifacts')]
+    assert len(listed) == 3
+
+def test_artifact_as_collection(content_server, tmp_path):
+    ids = _listing(content_server, 1, 1)
+    collection = _adapter(content_server, tmp_path).get_collection(ids[0])
+    assert _read_all(collection) == ids
+    assert not any(r[1].startswith('/1/artifacts') for r in content_server.requests)
+
+def test_local_adapter_listing(content_server, tmp_path):
+    for i in range(3):
+        content_server.content[f"/blobs/{i}"] = f"content {i}".encode()
+    content_server.content['/1/artifacts/urn:ivcap:artifact:2'] = json.dumps({
+        'id': 'urn:ivcap:artifact:2', 'data': {'self': '/blobs/2'}
+    }).encode()
+    content_server.content['/1/artifacts'] = json.dumps({'artifacts': [
+        {'id': 'urn:ivcap:artifact:0', 'data': {'self': f"{content_server.url}/blobs/0"}},
+        {'id': 'urn:ivcap:artifact:1', 'links': {'data': '/blobs/1'}},
+        # only the artifact record has the content link
+        {'id': 'urn:ivcap:artifact:2', 'links': {'self': '/1/artifacts/urn:ivcap:artifact:2'}},
+    ]}).encode()
+    adapter = LocalIOAdapter(str(tmp_path), str(tmp_path))
+    collection = adapter.get_collection(f"{content_server.url}/1/artifacts")
+    assert _read_all(collection) == [f"content {i}" for i in range(3)]
+
+def test_local_adapter_paged_listing(content_server, tmp_path):
+    for i in range(2):
+        content_server.content[f"/v2/blobs/{i}"] = f"content {i}".encode()
+    content_server.content['/1/artifacts'] = json.dumps({
+        'artifacts': [{'id': 'urn:ivcap:artifact:0', 'data': '/v2/blobs/0'}],
+        'links': {'next': '/v2/page2'},
+    }).encode()
+    # links of later pages are relative to those pages
+    content_server.content['/v2/page2'] = json.dumps({
+        'artifacts': [{'id': 'urn:ivcap:artifact:1', 'data': 'blobs/1'}],
+    }).encode()
+    adapter = LocalIOAdapter(str(tmp_path), str(tmp_path))
+    collection = adapter.get_collection(f"{content_server.url}/1/artifacts")
+    assert _read_all(collection) == ['content 0', 'content 1']
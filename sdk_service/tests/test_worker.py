@@ -0,0 +1,70 @@
+import json
+import sys
+import threading
+
+import pytest
+
+from ivcap_sdk_service import ivcap, worker
+from ivcap_sdk_service.config import Command, Config
+from ivcap_sdk_service.delivery import drain_deliveries
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    (tmp_path / 'orders').mkdir()
+    c = Config(['--ivcap:in-dir', str(tmp_path), '--ivcap:out-dir', str(tmp_path), '--ivcap:cache-dir', '', '--ivcap:worker', str(tmp_path)])
+    monkeypatch.setattr(ivcap, '_CONFIG', c)
+    monkeypatch.setattr(ivcap, 'DELIVERED', [])
+    return c
+
+def _run_order(args):
+    order_id = ivcap.get_order_id()
+    if args == ['--fail']:
+        raise Exception('failed')
+    ivcap.deliver_data(f"{order_id}.out", lambda fd: fd.write(' '.join(args)), 'text/plain')
+    drain_deliveries()
+    return 0
+
+def test_directory_orders(tmp_path, config, monkeypatch):
+    assert config.SERVICE_COMMAND == Command.SERVICE_WORKER
+    monkeypatch.setattr(worker, 'WORKER_IDLE_EXIT', 0.1)
+    monkeypatch.setattr(worker, 'WORKER_POLL', 0.01)
+    orders = tmp_path / 'orders'
+    (orders / 'o1.json').write_text(json.dumps({'args': {'size': 10, 'verbose': True, 'skip': False}}))
+    (orders / 'o2.json').write_text(json.dumps({'order_id': 'urn:o2', 'args': ['--fail']}))
+    (orders / 'o3.json').write_text('[]')
+    assert worker.run_worker(str(orders), _run_order) == 1
+    assert (tmp_path / 'o1.out').read_text() == '--size 10 --verbose'
+    assert (orders / 'o1.done').exists() and (orders / 'o2.failed').exists() and (orders / 'o3.failed').exists()
+    r1 = json.loads((orders / 'o1.result.json').read_text())
+    assert r1['code'] == 0 and [d['name'] for d in r1['delivered']] == ['o1.out']
+    r2 = json.loads((orders / 'o2.result.json').read_text())
+    assert r2['order_id'] == 'urn:o2' and r2['error'] == 'failed'
+    # the worker's own config is restored after each order
+    assert ivcap.get_config() is config and ivcap.get_order_id() == None
+
+def test_stdin_orders(tmp_path, config, monkeypatch):
+    results = tmp_path / 'results.jsonl'
+    monkeypatch.setattr(worker, 'WORKER_RESULTS', str(results))
+    monkeypatch.setattr('sys.stdin', iter([
+        '{"order_id": "a", "args": ["x"]}\n', 'garbage\n', '{"args": ["z"]}\n', '{"order_id": "b", "args": ["y"]}\n',
+    ]))
+    assert worker.run_worker('-', _run_order) == 0
+    assert (tmp_path / 'a.out').read_text() == 'x' and (tmp_path / 'b.out').read_text() == 'y'
+    assert [json.loads(l)['order_id'] for l in results.read_text().splitlines()] == ['a', 'b']
+
+def test_concurrent_orders(tmp_path, config, monkeypatch):
+    barrier = threading.Barrier(3, timeout=5)
+    def run_order(args):
+        barrier.wait() # all three orders run at the same time
+        return _run_order(args)
+    lines = [json.dumps({'order_id': f"o{i}", 'args': [str(i)]}) + '\n' for i in range(3)]
+    monkeypatch.setattr('sys.stdin', iter(lines))
+    assert worker.run_worker('-', run_order, concurrency=3) == 0
+    assert [(tmp_path / f"o{i}.out").read_text() for i in range(3)] == ['0', '1', '2']
+
+def test_exit_codes(config):
+    def run_order(args):
+        sys.exit(*args)
+    results = [worker.process_order({'order_id': 'o', 'args': args}, run_order) for args in ([], ['2'])]
+    assert results[0]['code'] == 0 and 'error' not in results[0]
+    assert results[1]['code'] == 1 and results[1]['error'] == 'exit(2)'
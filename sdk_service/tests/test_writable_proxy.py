@@ -0,0 +1,215 @@
+import base64
+import gzip
+import hashlib
+import io
+
+import pytest
+
+from ivcap_sdk_service.cio import compression, tus, utils, writable_proxy
+from ivcap_sdk_service.cio.dedup import DedupIndex
+from ivcap_sdk_service.cio.writable_proxy import WritableProxy
+from ivcap_sdk_service.itypes import UploadError
+
+def test_streaming_upload(content_server, monkeypatch):
+    monkeypatch.setattr(writable_proxy, 'STREAM_CHUNK_SIZE', 1000)
+    monkeypatch.setattr(writable_proxy, 'STREAM_MAX_CHUNKS', 2)
+    monkeypatch.setattr(writable_proxy, 'STREAM_MIN_SIZE', 5000)
+    ids = []
+    w = WritableProxy(content_server.url, 'image/png', name='a.png', on_close=lambda id, _: ids.append(id))
+    assert not w.seekable()
+    with pytest.raises(io.UnsupportedOperation):
+        w.seek(0)
+    for i in range(100):
+        w.write(bytes([i]) * 123)
+    assert w.tell() == 12300
+    w.close()
+    assert ids == ['urn:ivcap:artifact:1']
+    headers, body = content_server.posted[0]
+    assert headers['Transfer-Encoding'] == 'chunked'
+    assert headers['X-Name'] == 'a.png'
+    assert body == b''.join(bytes([i]) * 123 for i in range(100))
+
+def test_small_content_not_streamed(content_server):
+    w = WritableProxy(content_server.url, 'image/png', name='a.png')
+    assert not w.seekable()
+    w.write(b'small')
+    w.close()
+    headers, body = content_server.posted[0]
+    assert 'Transfer-Encoding' not in headers
+    assert body == b'small'
+
+def test_abort(content_server, monkeypatch):
+    monkeypatch.setattr(writable_proxy, 'STREAM_CHUNK_SIZE', 1000)
+    monkeypatch.setattr(writable_proxy, 'STREAM_MIN_SIZE', 0)
+    ids = []
+    for seekable in (False, True):
+        w = WritableProxy(content_server.url, 'image/png', is_seekable=seekable, on_close=lambda id, _: ids.append(id))
+        w.write(CONTENT)
+        w.abort()
+        assert w.closed
+    assert ids == []
+    assert content_server.posted == []
+
+def test_seekable_upload(content_server):
+    ids = []
+    w = WritableProxy(content_server.url, 'text/plain', name='a.txt', is_seekable=True, on_close=lambda id, _: ids.append(id))
+    w.write('hello world')
+    w.seek(0)
+    w.write('HELLO')
+    w.close()
+    assert ids == ['urn:ivcap:artifact:1']
+    headers, body = content_server.posted[0]
+    assert 'Transfer-Encoding' not in headers
+    assert body == b'HELLO world'
+
+CONTENT = bytes(range(256)) * 40
+
+@pytest.fixture
+def tus_server(content_server, monkeypatch):
+    monkeypatch.setattr(tus, 'UPLOAD_CHUNK_SIZE', 1000)
+    monkeypatch.setattr(tus, 'UPLOAD_RETRY_DELAY', 0)
+    content_server.tus = True
+    return content_server
+
+def _upload(content_server):
+    ids = []
+    w = WritableProxy(content_server.url, 'image/png', name='a.png', is_seekable=True, on_close=lambda id, _: ids.append(id))
+    w.write(CONTENT)
+    w.close()
+    return ids
+
+def test_resumable_upload(tus_server):
+    tus_server.fail_patches = 2
+    assert _upload(tus_server) == ['urn:ivcap:artifact:1']
+    headers, body = tus_server.posted[0]
+    assert headers['Upload-Length'] == str(len(CONTENT))
+    assert headers['X-Name'] == 'a.png'
+    assert body == CONTENT
+    patches = [r for r in tus_server.requests if r[0] == 'PATCH']
+    # two failed requests which stored 500 bytes each, then 10 chunks for the rest
+    assert len(patches) == 12
+    assert sum(1 for r in tus_server.requests if r[0] == 'HEAD') == 2
+
+def test_parallel_resumable_upload(tus_server, monkeypatch):
+    monkeypatch.setattr(tus, 'UPLOAD_PARALLEL', 3)
+    assert _upload(tus_server) == ['urn:ivcap:artifact:1']
+    headers, body = tus_server.posted[0]
+    assert headers['Upload-Concat'].startswith('final;')
+    assert body == CONTENT
+
+def test_parallel_upload_without_concatenation(tus_server, monkeypatch):
+    monkeypatch.setattr(tus, 'UPLOAD_PARALLEL', 3)
+    tus_server.tus_extensions = 'creation'
+    assert _upload(tus_server) == ['urn:ivcap:artifact:1']
+    headers, body = tus_server.posted[0]
+    assert 'Upload-Concat' not in headers
+    assert body == CONTENT
+    assert len(tus_server.uploads) == 1
+
+def test_no_tus_support(content_server, monkeypatch):
+    monkeypatch.setattr(tus, 'UPLOAD_CHUNK_SIZE', 1000)
+    assert _upload(content_server) == ['urn:ivcap:artifact:1']
+    # no upload is created before finding out that TUS isn't supported
+    assert [r[0] for r in content_server.requests] == ['OPTIONS', 'POST']
+    headers, body = content_server.posted[0]
+    assert 'Tus-Resumable' not in headers and body == CONTENT
+
+def test_upload_error(content_server, monkeypatch):
+    monkeypatch.setattr(utils, 'HTTP_RETRIES', 0)
+    monkeypatch.setattr(utils, '_SESSION', None)
+    monkeypatch.setattr(content_server, 'url', content_server.url + '/missing')
+    content_server.server_close()
+    content_server.shutdown()
+    w = WritableProxy(content_server.url, 'image/png', is_seekable=True)
+    w.write(CONTENT)
+    with pytest.raises(UploadError):
+        w.close()
+
+def test_metadata_records(content_server):
+    metadata = [{'$schema': f"urn:schema:{i}", 'i': i, 'a': 1, 'b': 2, 'c': 3} for i in range(5)]
+    w = WritableProxy(content_server.url, 'image/png', metadata=metadata)
+    w.write(b'data')
+    w.close()
+    assert len(content_server.posted) == 6
+    records = content_server.posted[1:]
+    assert all(h['X-Meta-Data-For-Artifact'] == 'urn:ivcap:artifact:1' for h, _ in records)
+    assert sorted(h['X-Meta-Data-Schema'] for h, _ in records) == [f"urn:schema:{i}" for i in range(5)]
+
+def test_compressed_uploads(content_server, monkeypatch):
+    monkeypatch.setattr(compression, 'UPLOAD_COMPRESSION', 'gzip')
+    monkeypatch.setattr(compression, 'UPLOAD_COMPRESSION_MIN_SIZE', 100)
+    rows = ''.join(f"{i},{i * i}\n" for i in range(1000))
+    for seekable in (False, True):
+        w = WritableProxy(content_server.url, 'text/csv', is_seekable=seekable)
+        w.write(rows)
+        w.close()
+    w = WritableProxy(content_server.url, 'image/png')
+    w.write(CONTENT)
+    w.close()
+    for headers, body in content_server.posted[:2]:
+        assert headers['Content-Encoding'] == 'gzip'
+        assert len(body) < len(rows) / 2
+        assert gzip.decompress(body).decode() == rows
+    headers, body = content_server.posted[2]
+    assert 'Content-Encoding' not in headers and body == CONTENT
+
+def test_dedup(content_server, tmp_path):
+    def upload(index, name, data):
+        ids = []
+        w = WritableProxy(content_server.url, 'image/png', name=name, dedup=index, on_close=lambda id, _: ids.append(id))
+        assert w.seekable()
+        w.write(data)
+        w.close()
+        return ids[0]
+    path = str(tmp_path / 'uploads.jsonl')
+    first = upload(DedupIndex(path), 'a.png', CONTENT)
+    assert content_server.posted[0][0]['Digest'] == 'sha-256=' + base64.b64encode(hashlib.sha256(CONTENT).digest()).decode()
+    # e.g. a retried order
+    assert upload(DedupIndex(path), 'a.png', CONTENT) == first
+    assert len(content_server.posted) == 1
+    assert upload(DedupIndex(path), 'b.png', CONTENT) != first
+    assert upload(DedupIndex(path), 'a.png', CONTENT[1:]) != first
+    assert len(content_server.posted) == 3
+
+def test_dedup_metadata_and_collection(content_server, tmp_path):
+    index = DedupIndex(str(tmp_path / 'uploads.jsonl'))
+    def upload(collection_name, metadata=None):
+        ids = []
+        w = WritableProxy(content_server.url, 'image/png', name='a.png', metadata=metadata, dedup=index,
+            collection_name=collection_name, on_close=lambda id, _: ids.append(id))
+        w.write(CONTENT)
+        w.close()
+        return ids[0]
+    first = upload('c1')
+    assert upload('c2') != first
+    assert len(content_server.posted) == 2
+    # metadata of a reused artifact is still recorded
+    assert upload('c1', metadata={'$schema': 'urn:schema:a', 'a': 1}) == first
+    assert len(content_server.posted) == 3
+    headers, _ = content_server.posted[2]
+    assert headers['X-Meta-Data-For-Artifact'] == first
+    assert headers['X-Meta-Data-For-Url'] == f"{content_server.url}/1/artifacts/{first}"
+
+def test_dedup_compressed(content_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(compression, 'UPLOAD_COMPRESSION', 'gzip')
+    monkeypatch.setattr(compression, 'UPLOAD_COMPRESSION_MIN_SIZE', 100)
+    index = DedupIndex(str(tmp_path / 'uploads.jsonl'))
+    rows = ''.join(f"{i},{i * i}\n" for i in range(1000))
+    for _ in range(2):
+        w = WritableProxy(content_server.url, 'text/csv', name='a.csv', dedup=index)
+        w.write(rows)
+        w.close()
+    assert len(content_server.posted) == 1
+    headers, body = content_server.posted[0]
+    assert headers['Content-Encoding'] == 'gzip'
+    # the digest is of the bytes sent, not of the content
+    assert headers['Digest'] == 'sha-256=' + base64.b64encode(hashlib.sha256(body).digest()).decode()
+    assert gzip.decompress(body).decode() == rows
+
+def test_resumable_upload_without_digest(tus_server, tmp_path):
+    w = WritableProxy(tus_server.url, 'image/png', name='a.png', dedup=DedupIndex(str(tmp_path / 'uploads.jsonl')))
+    w.write(CONTENT)
+    w.close()
+    headers, body = tus_server.posted[0]
+    assert 'Upload-Length' in headers and 'Digest' not in headers
+    assert body == CONTENT